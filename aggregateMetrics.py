@@ -0,0 +1,149 @@
+import argparse # This takes in any command-line arguments that the users enters.
+import json # to save the answers, if you'd like them.
+import os # This allows us to check other directories, if we need to.
+
+import userTestingTool as utt
+
+"""
+Aggregate Metrics
+Answer questions about a whole study (every participant's session) at once.
+
+The csv files made by videoToMetricsConverter.py are added to a session store (a
+folder of compact binary columns), and only new or changed files are read each time,
+so it stays quick with hundreds of sessions.
+
+Usage: python3 aggregateMetrics.py <path/to/metrics_data>
+
+Args:
+    metrics_data (str/list): Path to the metrics data.
+                             If you provide a directory, it will add all the csv files in the directory.
+                             If you provide a file (or list of files), it will add the file(s) listed.
+    store (str): The folder where the session store is kept. Default = "<metrics_data>/.session_store".
+    query (str): "dwell" (time on each page), "transitions" (which page users went to next),
+                 "funnel" (how many sessions made it through the --funnel pages),
+                 "paths" (the most common runs of pages), or "all". Default = "all".
+    funnel (str/list): The pages of the funnel, in order, e.g. home,search,cart. Default = "".
+    path_length (int): How many pages in a row make up a path. Default = 3.
+    top (int): How many of the most common paths to show. Default = 10.
+    compact (bool): Rewrite the store without the old versions of changed files. Default = False.
+    output_file (str): If given, the answers are also saved to this .json file. Default = "".
+
+Returns:
+    None
+"""
+
+def print_dwell(dwell):
+    print("{:<28}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+        "page", "visits", "sessions", "mean(s)", "median(s)", "p90(s)"))
+    for page, stats in sorted(dwell.items(), key=lambda item: -item[1]["total"]):
+        print("{:<28}{:>8}{:>10}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+            page, stats["visits"], stats["sessions"], stats["mean"],
+            stats["median"], stats["p90"]))
+
+def print_transitions(pages, matrix):
+    print("From -> to (visits)")
+    for from_page, row in zip(pages, matrix):
+        if row.sum() == 0:
+            continue
+        next_pages = ["{} ({})".format(pages[to], int(row[to]))
+                      for to in row.argsort()[::-1] if row[to] > 0]
+        print("    {}: {}".format(from_page, ", ".join(next_pages)))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate Metrics\n"
+                    "Answer questions about a whole study (every participant's session) at once.",
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        "metrics_data",
+        type=utt.string_or_list,
+        help="Path to the metrics data.\n"
+             "If you provide a directory, it will add all the csv files in the directory.\n"
+             "If you provide a file (or list of files), it will add the file(s) listed.")
+    parser.add_argument(
+        "--store",
+        type=str,
+        default="",
+        help='The folder where the session store is kept. Default = "<metrics_data>/.session_store"')
+    parser.add_argument(
+        "--query",
+        type=str,
+        choices=["dwell", "transitions", "funnel", "paths", "all"],
+        default="all",
+        help='"dwell" (time on each page), "transitions" (which page users went to next),\n'
+             '"funnel" (how many sessions made it through the --funnel pages),\n'
+             '"paths" (the most common runs of pages), or "all". Default = "all"')
+    parser.add_argument(
+        "--funnel",
+        type=utt.string_or_list,
+        default="",
+        help='The pages of the funnel, in order, e.g. home,search,cart. Default = ""')
+    parser.add_argument(
+        "--path_length",
+        type=int,
+        default=3,
+        help="How many pages in a row make up a path. Default = 3")
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="How many of the most common paths to show. Default = 10")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Rewrite the store without the old versions of changed files.")
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default="",
+        help='If given, the answers are also saved to this .json file. Default = ""')
+    args = parser.parse_args()
+
+    ## IF THE USER SPECIFIES ONE OR MORE .CSV FILES ##
+    if type(args.metrics_data) == list:
+        csv_names = args.metrics_data
+        metrics_folder = os.path.dirname(csv_names[0])
+    elif args.metrics_data[-4:].lower() == ".csv":
+        csv_names = [args.metrics_data]
+        metrics_folder = os.path.dirname(args.metrics_data)
+    else:
+        csv_names = sorted(utt.getFileNames(args.metrics_data, [".csv"]))
+        metrics_folder = args.metrics_data
+    #################################################
+
+    store_folder = args.store or os.path.join(metrics_folder, ".session_store")
+    store = utt.SessionStore(store_folder)
+    added, updated, unchanged = store.ingest(csv_names)
+    print("Sessions: {} added, {} updated, {} unchanged ({} in the store).".format(
+        added, updated, unchanged, store.session_count()))
+    if args.compact:
+        store.compact()
+
+    answers = {"sessions": store.session_count()}
+    if args.query in ("dwell", "all"):
+        answers["dwell"] = store.dwell_stats()
+        print_dwell(answers["dwell"])
+    if args.query in ("transitions", "all"):
+        matrix = store.transition_matrix()
+        answers["transitions"] = {"pages": store.pages,
+                                  "matrix": matrix.tolist()}
+        print_transitions(store.pages, matrix)
+    if args.query in ("funnel", "all") and args.funnel:
+        steps = args.funnel if type(args.funnel) == list else [args.funnel]
+        answers["funnel"] = store.funnel(steps)
+        print("Funnel:")
+        started = max(answers["funnel"][0][1], 1)
+        for step, sessions in answers["funnel"]:
+            print("    {:<24}{:>6} sessions ({:.0f}%)".format(
+                step, sessions, 100*sessions/started))
+    if args.query in ("paths", "all"):
+        answers["paths"] = store.common_paths(args.path_length, args.top)
+        print("Most common paths:")
+        for path, count in answers["paths"]:
+            print("    {:>6}  {}".format(count, " -> ".join(path)))
+    if args.output_file:
+        with open(args.output_file, "w") as output_file:
+            json.dump(answers, output_file, indent=4)
+
+if __name__ == "__main__":
+    main()
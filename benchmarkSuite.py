@@ -0,0 +1,400 @@
+import argparse # This takes in any command-line arguments that the users enters.
+import itertools # to try every combination of settings.
+import json # to save the results, for comparing against later runs.
+import os # This allows us to check other directories, if we need to.
+import random # for scripting the (repeatable) made-up user sessions.
+import shutil # to find ffmpeg, and tidy up the made-up videos afterwards.
+import subprocess # to run ffmpeg, for codecs that OpenCV can't write.
+import tempfile # somewhere to keep the made-up videos.
+import time # to time each stage.
+
+import cv2 # I am running version 4.7.0
+import numpy as np # for the percentiles
+import userTestingTool as utt
+
+"""
+Benchmark Suite
+Measure how quickly (and how accurately) videoToMetricsConverter.py works, on made-up
+recordings where we know exactly which page was on screen, and when.
+
+Every combination of resolution, length, codec, keyframe interval and number of screens
+gets its own video: a scripted (random, but repeatable) session that visits the app
+screenshots in turn. Each video is analysed, with every stage timed, and the page changes
+that were found are compared with the script.
+
+Usage: python3 benchmarkSuite.py <path/to/app_screenshots>
+
+Args:
+    app_screens_directory (str): Path to the App Screens Directory.
+    resolutions (str/list): The heights of the videos (in pixels). Default = 480,960.
+    lengths (str/list): The lengths of the videos (in seconds). Default = 30.
+    codecs (str/list): Four letter OpenCV codes (e.g. mp4v, MJPG), or ffmpeg encoders (e.g. libx264). Default = mp4v.
+    keyframe_intervals (str/list): Frames between keyframes (ffmpeg encoders only). 0 leaves it to the codec. Default = 0.
+    screen_counts (str/list): How many of the screenshots are used. 0 uses all of them. Default = 0.
+    fps (float): The frame rate of the videos. Default = 30.
+    min_dwell (float): The shortest time (in seconds) spent on a page. Default = 1.
+    max_dwell (float): The longest time (in seconds) spent on a page. Default = 6.
+    noise (float): How much random noise (0-255) is added to each frame, like video compression. Default = 2.
+    seed (int): Makes the scripted sessions repeatable. Default = 0.
+    features (str): As in videoToMetricsConverter.py. Default = "sift".
+    matcher (str): As in videoToMetricsConverter.py. Default = "brute".
+    sample_rate (int): As in videoToMetricsConverter.py. Default = 2.
+    resize_factor (float): As in videoToMetricsConverter.py. Default = 0.25.
+    video_directory (str): Keep the made-up videos in this folder (instead of deleting them). Default = "".
+    output_file (str): Where we save the results. Default = "benchmark.json".
+
+Returns:
+    None
+"""
+
+stages = ["screenshots", "decode", "resize", "detect_and_compute", "match",
+          "cleanup", "csv_write"]
+
+def navigation_script(pages, length, min_dwell, max_dwell, rng):
+    """A made-up session: [(start time in seconds, page), ...], never visiting
+    the same page twice in a row, until length seconds are up."""
+    script = []
+    current_time = 0
+    while current_time < length:
+        choices = [page for page in pages
+                   if len(script) == 0 or page != script[-1][1]]
+        script.append((current_time, rng.choice(choices)))
+        current_time += rng.uniform(min_dwell, max_dwell)
+    return script
+
+def page_at(script, seconds):
+    """Which page the script shows at this time."""
+    page = script[0][1]
+    for start, next_page in script:
+        if start > seconds:
+            break
+        page = next_page
+    return page
+
+def render_frames(image_names, script, length, fps, size, noise, rng):
+    """Yields every frame of the scripted session, at size (width, height)."""
+    pages = {utt.file_title(image_path):
+             cv2.resize(cv2.imread(image_path), size,
+                        interpolation=cv2.INTER_AREA).astype(np.int16)
+             for image_path in image_names}
+    # a few noise patterns, reused, are plenty (and much quicker).
+    noise_rng = np.random.default_rng(rng.randrange(2**32))
+    patterns = [noise_rng.normal(0, noise, (size[1], size[0], 3)).astype(np.int16)
+                for _ in range(4)] if noise > 0 else [0]
+    for n in range(int(length*fps)):
+        frame = pages[page_at(script, n/fps)] + patterns[n % len(patterns)]
+        yield np.clip(frame, 0, 255).astype(np.uint8)
+
+def write_video(path, frames, fps, size, codec, keyframe_interval=0):
+    """Saves the frames with an OpenCV four letter codec (e.g. mp4v), or an
+    ffmpeg encoder (e.g. libx264, which can also set the keyframe interval).
+    Returns the keyframe interval that was used (None for the codec's own)."""
+    if len(codec) == 4:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+        return None
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is needed for the " + codec + " codec.")
+    command = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "bgr24",
+               "-s", "{}x{}".format(*size), "-r", str(fps), "-i", "-",
+               "-c:v", codec, "-pix_fmt", "yuv420p"]
+    if keyframe_interval > 0:
+        command += ["-g", str(keyframe_interval)]
+    process = subprocess.Popen(command + [path], stdin=subprocess.PIPE)
+    for frame in frames:
+        process.stdin.write(frame.tobytes())
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError("ffmpeg couldn't write " + path)
+    return keyframe_interval if keyframe_interval > 0 else None
+
+def timed_frames(frames, timings):
+    """Passes the frames on, timing how long each one took to decode."""
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(frames)
+        except StopIteration:
+            return
+        timings.setdefault("decode", []).append(time.perf_counter() - start)
+        yield item
+
+def summarise(durations):
+    """The total, mean and percentiles of a stage's durations."""
+    if len(durations) == 0:
+        return {"count": 0}
+    milliseconds = 1000*np.array(durations)
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    return {"count": len(durations),
+            "total_seconds": float(milliseconds.sum()/1000),
+            "mean_ms": float(milliseconds.mean()), "p50_ms": float(p50),
+            "p95_ms": float(p95), "p99_ms": float(p99)}
+
+def transition_accuracy(rows, script, tolerance):
+    """Compares the page changes in the csv rows with the script's. A change
+    counts as found if the new page matches, within tolerance seconds."""
+    truth = [(start, page[:-4]) for start, page in script[1:]]
+    found = [(rows[i][2], rows[i+1][0]) for i in range(len(rows)-1)]
+    unmatched = list(found)
+    errors = []
+    for start, page in truth:
+        nearby = [change for change in unmatched if change[1] == page and
+                  abs(change[0] - start) <= tolerance]
+        if nearby:
+            best = min(nearby, key=lambda change: abs(change[0] - start))
+            unmatched.remove(best)
+            errors.append(abs(best[0] - start))
+    matched = len(errors)
+    precision = matched/len(found) if found else 1.0
+    recall = matched/len(truth) if truth else 1.0
+    return {"true_transitions": len(truth), "found_transitions": len(found),
+            "matched": matched, "precision": precision, "recall": recall,
+            "f1": (2*precision*recall/(precision + recall)
+                   if precision + recall > 0 else 0.0),
+            "mean_error_seconds": float(np.mean(errors)) if errors else None}
+
+def frame_accuracy(samples, script, feature_cutoff):
+    """How many of the analysed frames were labelled with the right page."""
+    if len(samples) == 0:
+        return 0.0
+    correct = sum(sample[0][1] > feature_cutoff and
+                  sample[0][0] == page_at(script, sample[1])
+                  for sample in samples)
+    return correct/len(samples)
+
+def benchmark_video(video_path, index, options, script, output_folder):
+    """Analyses one made-up video, timing every stage."""
+    index.timings = timings = {}
+    video = cv2.VideoCapture(video_path)
+    total_frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    decode_stats = {"decode_seconds": 0.0, "frames_decoded": 0,
+                    "frames_covered": 0}
+    frames = timed_frames(utt.sequential_frames(video, 1000/options.sample_rate,
+                                                decode_stats), timings)
+    start = time.perf_counter()
+    samples = [sample for sample, _ in
+               utt.stream_samples(video_path, index, options, False,
+                                  frames=frames, decode_stats=decode_stats)]
+    video.release()
+
+    cleanup_start = time.perf_counter()
+    rows = utt.clean_timeline(samples, options.feature_cutoff)
+    timings["cleanup"] = [time.perf_counter() - cleanup_start]
+    write_start = time.perf_counter()
+    utt.write_timeline_csv(rows, os.path.join(output_folder, "timings.csv"),
+                           options.header)
+    timings["csv_write"] = [time.perf_counter() - write_start]
+    seconds = time.perf_counter() - start
+    index.timings = None
+
+    return {"frames_analysed": len(samples),
+            "video_frames": total_frame_count,
+            "seconds": seconds,
+            "analysed_frames_per_second": len(samples)/seconds,
+            "video_frames_per_second": total_frame_count/seconds,
+            "stages": {stage: summarise(timings.get(stage, []))
+                       for stage in stages if stage != "screenshots"},
+            "transitions": transition_accuracy(rows, script,
+                                               1/options.sample_rate + 0.1),
+            "frame_accuracy": frame_accuracy(samples, script,
+                                             options.feature_cutoff)}
+
+def values(arg_value, kind=str):
+    """"480,960" -> [480, 960] (with kind=int)"""
+    arg_values = utt.string_or_list(arg_value)
+    if type(arg_values) != list:
+        arg_values = [arg_values]
+    return [kind(value) for value in arg_values]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Suite\n"
+                    "Measure how quickly (and how accurately) videoToMetricsConverter.py works,\n"
+                    "on made-up recordings of your app screenshots.",
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        "app_screens_directory",
+        type=str,
+        help="Path to the App Screens Directory.")
+    parser.add_argument(
+        "--resolutions",
+        type=str,
+        default="480,960",
+        help="The heights of the videos (in pixels). Default = 480,960")
+    parser.add_argument(
+        "--lengths",
+        type=str,
+        default="30",
+        help="The lengths of the videos (in seconds). Default = 30")
+    parser.add_argument(
+        "--codecs",
+        type=str,
+        default="mp4v",
+        help="Four letter OpenCV codes (e.g. mp4v, MJPG), or ffmpeg encoders\n"
+             "(e.g. libx264, if ffmpeg is installed). Default = mp4v")
+    parser.add_argument(
+        "--keyframe_intervals",
+        type=str,
+        default="0",
+        help="Frames between keyframes (ffmpeg encoders only). 0 leaves it to the codec. Default = 0")
+    parser.add_argument(
+        "--screen_counts",
+        type=str,
+        default="0",
+        help="How many of the screenshots are used. 0 uses all of them. Default = 0")
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=30,
+        help="The frame rate of the videos. Default = 30")
+    parser.add_argument(
+        "--min_dwell",
+        type=float,
+        default=1,
+        help="The shortest time (in seconds) spent on a page. Default = 1")
+    parser.add_argument(
+        "--max_dwell",
+        type=float,
+        default=6,
+        help="The longest time (in seconds) spent on a page. Default = 6")
+    parser.add_argument(
+        "--noise",
+        type=float,
+        default=2,
+        help="How much random noise (0-255) is added to each frame. Default = 2")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Makes the scripted sessions repeatable. Default = 0")
+    parser.add_argument(
+        "--features",
+        type=str,
+        choices=list(utt.feature_backends.keys()),
+        default=utt.DEFAULT_OPTIONS["features"],
+        help='As in videoToMetricsConverter.py. Default = "sift"')
+    parser.add_argument(
+        "--matcher",
+        type=str,
+        choices=["brute", "flann"],
+        default=utt.DEFAULT_OPTIONS["matcher"],
+        help='As in videoToMetricsConverter.py. Default = "brute"')
+    parser.add_argument(
+        "--sample_rate",
+        type=int,
+        default=utt.DEFAULT_OPTIONS["sample_rate"],
+        help="As in videoToMetricsConverter.py. Default = 2")
+    parser.add_argument(
+        "--resize_factor",
+        type=float,
+        default=utt.DEFAULT_OPTIONS["resize_factor"],
+        help="As in videoToMetricsConverter.py. Default = 0.25")
+    parser.add_argument(
+        "--video_directory",
+        type=str,
+        default="",
+        help='Keep the made-up videos in this folder (instead of deleting them). Default = ""')
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default="benchmark.json",
+        help='Where we save the results. Default = "benchmark.json"')
+    args = parser.parse_args()
+
+    options = utt.default_options(features=args.features, matcher=args.matcher,
+                                  sample_rate=args.sample_rate,
+                                  resize_factor=args.resize_factor)
+    image_names = sorted(utt.getFileNames(args.app_screens_directory,
+                                          utt.image_extensions))
+    # every video has the same shape as the screenshots.
+    first_image = cv2.imread(image_names[0])
+    aspect = first_image.shape[1]/first_image.shape[0]
+
+    if args.video_directory:
+        video_folder = args.video_directory
+        os.makedirs(video_folder, exist_ok=True)
+    else:
+        video_folder = tempfile.mkdtemp(prefix="benchmark_videos_")
+
+    results = []
+    indexes = {} # one ScreenIndex per number of screens
+    try:
+        for height, length, codec, keyframe_interval, screen_count in itertools.product(
+                values(args.resolutions, int), values(args.lengths, float),
+                values(args.codecs), values(args.keyframe_intervals, int),
+                values(args.screen_counts, int)):
+            screens = image_names[:screen_count] if screen_count > 0 else image_names
+            if len(screens) not in indexes:
+                start = time.perf_counter()
+                indexes[len(screens)] = (utt.ScreenIndex.from_screenshots(
+                    screens, options.resize_factor, options.features,
+                    options.matcher), time.perf_counter() - start)
+            index, screenshot_seconds = indexes[len(screens)]
+
+            # the same settings always get the same session.
+            rng = random.Random("{}|{}|{}".format(args.seed, length, len(screens)))
+            script = navigation_script([utt.file_title(image_path)
+                                        for image_path in screens],
+                                       length, args.min_dwell, args.max_dwell,
+                                       rng)
+            size = (int(round(height*aspect/2))*2, height)
+            name = "synthetic-{}p-{}s-{}-g{}-{}screens".format(
+                height, int(length), codec, keyframe_interval, len(screens))
+            # motion JPEG only fits in an .avi file.
+            extension = ".avi" if codec.upper() == "MJPG" else ".mp4"
+            video_path = os.path.join(video_folder, name + extension)
+            print("Benchmarking " + name + "...")
+            try:
+                used_interval = write_video(
+                    video_path, render_frames(screens, script, length,
+                                              args.fps, size, args.noise, rng),
+                    args.fps, size, codec, keyframe_interval)
+            except RuntimeError as error:
+                print("    Skipped: " + str(error))
+                continue
+            result = {"video": name, "height": height, "width": size[0],
+                      "length_seconds": length, "codec": codec,
+                      "keyframe_interval": used_interval,
+                      "screens": len(screens),
+                      "video_bytes": os.path.getsize(video_path)}
+            result.update(benchmark_video(video_path, index, options, script,
+                                          video_folder))
+            result["stages"]["screenshots"] = {"count": len(screens),
+                                               "total_seconds": screenshot_seconds}
+            results.append(result)
+            print("    {:.1f} analysed frames/sec, transitions F1 {:.2f}, "
+                  "frames correct {:.1f}%".format(
+                      result["analysed_frames_per_second"],
+                      result["transitions"]["f1"],
+                      100*result["frame_accuracy"]))
+    finally:
+        if not args.video_directory:
+            shutil.rmtree(video_folder, ignore_errors=True)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "opencv_version": cv2.__version__,
+              "settings": {"features": options.features,
+                           "matcher": options.matcher,
+                           "sample_rate": options.sample_rate,
+                           "resize_factor": options.resize_factor,
+                           "fps": args.fps, "noise": args.noise,
+                           "seed": args.seed},
+              "results": results}
+    with open(args.output_file, "w") as output_file:
+        json.dump(report, output_file, indent=4)
+
+    print("{:<40}{:>10}{:>10}{:>10}{:>8}".format("video", "frames/s",
+                                                 "extract", "match", "F1"))
+    for result in results:
+        print("{:<40}{:>10.1f}{:>8.1f}ms{:>8.1f}ms{:>8.2f}".format(
+            result["video"], result["analysed_frames_per_second"],
+            result["stages"]["detect_and_compute"].get("p50_ms", 0),
+            result["stages"]["match"].get("p50_ms", 0),
+            result["transitions"]["f1"]))
+    print("Saved " + args.output_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse # This takes in any command-line arguments that the users enters.
+import json # to save the results for later.
+import time # to time each feature backend.
+
+import userTestingTool as utt
+
+"""
+Feature Benchmark
+Compare how quickly (and how similarly) each feature backend classifies a video.
+
+Usage: python3 featureBenchmark.py <path/to/app_screenshots> <path/to/screen_recording>
+
+Args:
+    app_screens_directory (str): Path to the App Screens Directory.
+    video_recording (str): Path to one Video Recording.
+    backends (str/list): The feature backends to compare. The first one is the reference
+                         that the others are compared against. Default = every available backend.
+    matcher (str): "brute" or "flann", as in videoToMetricsConverter.py. Default = "brute".
+    sample_rate (int): The number of times we analyse the video (per second). Default = 2.
+    resize_factor (float): The percentage of the original images that we shrink by for analysis. Default = 0.25.
+    output_file (str): If given, the results are also saved to this .json file. Default = "".
+
+Returns:
+    None
+"""
+
+
+def benchmark_backend(backend, image_names, video_name, options):
+    """Classifies every sampled frame of the video with one feature backend.
+    Returns the index, the timeline, and how long the screenshots and the
+    video took."""
+    start = time.perf_counter()
+    index = utt.ScreenIndex.from_screenshots(image_names,
+                                             options.resize_factor, backend,
+                                             options.matcher)
+    screenshot_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    timeline = utt.analyse_video(video_name, index, options, verbose=False)
+    video_seconds = time.perf_counter() - start
+    return index, timeline.samples, screenshot_seconds, video_seconds
+
+def labels(timeline, feature_cutoff):
+    return [sample[0][0] if sample[0][1] > feature_cutoff else None
+            for sample in timeline]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Feature Benchmark\n"
+                    "Compare how quickly (and how similarly) each feature backend classifies a video.",
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        "app_screens_directory",
+        type=str,
+        help="Path to the App Screens Directory.")
+    parser.add_argument(
+        "video_recording",
+        type=str,
+        help="Path to one Video Recording.")
+    parser.add_argument(
+        "--backends",
+        type=utt.string_or_list,
+        default=",".join(utt.feature_backends.keys()),
+        help="The feature backends to compare. The first one is the reference that the\n"
+             "others are compared against. Default = every available backend")
+    parser.add_argument(
+        "--matcher",
+        type=str,
+        choices=["brute", "flann"],
+        default="brute",
+        help='"brute" or "flann", as in videoToMetricsConverter.py. Default = "brute"')
+    parser.add_argument(
+        "--sample_rate",
+        type=int,
+        default=2,
+        help="The number of times we analyse the video (per second). Default = 2")
+    parser.add_argument(
+        "--resize_factor",
+        type=float,
+        default=0.25,
+        help="The percentage of the original images that we shrink by, for analysis. Default = 0.25")
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default="",
+        help='If given, the results are also saved to this .json file. Default = ""')
+    benchmark_args = parser.parse_args()
+    backends = benchmark_args.backends
+    if type(backends) == str:
+        backends = [backends]
+
+    # every other setting is videoToMetricsConverter.py's default.
+    options = utt.default_options(matcher=benchmark_args.matcher,
+                                  sample_rate=benchmark_args.sample_rate,
+                                  resize_factor=benchmark_args.resize_factor)
+    image_names = utt.getFileNames(benchmark_args.app_screens_directory,
+                                   utt.image_extensions)
+
+    results = []
+    reference = None
+    for backend in backends:
+        print("Benchmarking " + backend + "...")
+        try:
+            index, timeline, screenshot_seconds, video_seconds = benchmark_backend(
+                backend, image_names, benchmark_args.video_recording, options)
+        except ValueError as error: # e.g. no AKAZE in this version of OpenCV.
+            print(error)
+            continue
+        backend_labels = labels(timeline, options.feature_cutoff)
+        if reference is None:
+            reference = backend_labels
+        compared = min(len(reference), len(backend_labels))
+        agreed = sum(reference[i] == backend_labels[i] for i in range(compared))
+        results.append({"backend": backend,
+                        "detector_settings": index.detector_settings,
+                        "matcher": options.matcher,
+                        "screenshot_seconds": screenshot_seconds,
+                        "video_seconds": video_seconds,
+                        "frames": len(timeline),
+                        "frames_per_second": len(timeline)/max(video_seconds, 1e-9),
+                        "agreement": agreed/max(compared, 1)})
+
+    print("{:<8}{:>14}{:>14}{:>12}".format("backend", "screenshots(s)",
+                                           "frames/sec", "agreement"))
+    for result in results:
+        print("{:<8}{:>14.2f}{:>14.1f}{:>11.1f}%".format(
+            result["backend"], result["screenshot_seconds"],
+            result["frames_per_second"], 100*result["agreement"]))
+    if benchmark_args.output_file:
+        with open(benchmark_args.output_file, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2607 @@
+import argparse # the analysis options are kept in the same kind of object as the command-line arguments.
+import importlib # so OpenCV and numpy are only loaded when we need them.
+import os # This allows us to check other directories, if we need to.
+from tqdm import tqdm # This makes the pretty loading bars that you see
+import csv # to write the timings to a csv file.
+import time # to measure how quickly we decode the video.
+import tempfile # somewhere to share the screenshot features with other processes
+import shutil # to tidy up that shared folder afterwards
+import traceback # so one broken video doesn't stop a whole batch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json # to save how each csv file was made.
+import hashlib # to recognise screenshots that we've already seen before.
+import sys # to read live frames from stdin
+import subprocess # to run ffmpeg, for following a recording as it grows
+import threading # so frames keep arriving while we classify
+import queue # to hand frames from the reading thread to the classifier
+import cProfile # to see exactly where the time goes, if we're asked to
+import pstats
+import bisect # to find the frames around each likely page change
+import sqlite3 # to remember which page each frame showed, between runs
+
+"""
+User Testing Tool
+The library behind videoToMetricsConverter.py and plottingMetrics.py, so you
+can use them from your own Python code (without starting a new program for
+every video).
+
+Usage:
+    import userTestingTool as utt
+
+    index = utt.ScreenIndex.from_screenshots("app_screenshots")
+    options = utt.default_options(sample_rate=4)
+    for video_name in videos:
+        timeline = utt.analyse_video(video_name, index, options)
+        csv_path = timeline.save("generated_metrics", options)
+        utt.render_plot(csv_path, index.page_names, "generated_plots")
+
+OpenCV, numpy and matplotlib are only imported the first time they're used,
+so importing this library is quick, and a long-running program only pays for
+them (and for calculating the screenshot features) once.
+"""
+
+
+class LazyModule:
+    """Stands in for a module, and only imports it the first time it's used."""
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+cv2 = LazyModule("cv2") # I am running version 4.7.0
+np = LazyModule("numpy") # for stacking all the screenshot features together
+
+image_extensions = [".jpg", ".jpeg", ".png",".raw"]
+video_extensions = [".mp4", ".mov", ".avi"]
+
+# The defaults for every analysis option (see videoToMetricsConverter.py --help).
+DEFAULT_OPTIONS = {
+    "sample_rate": 2,
+    "resize_factor": 0.25,
+    "feature_cutoff": 10,
+    "features": "sift",
+    "matcher": "brute",
+    "flann_ratio": 0.8,
+    "workers": 1,
+    "segments": 1,
+    "change_threshold": 0,
+    "adaptive": False,
+    "coarse_interval": 2,
+    "target_resolution": 0.1,
+    "transition_graph": "",
+    "prior_successors": 3,
+    "prior_margin": 30,
+    "prior_validate": False,
+    "cascade_top_k": 0,
+    "cascade_max_distance": 0,
+    "cascade_validate": False,
+    "decode_mode": "sequential",
+    "gray_frames": False,
+    "burst_factor": 4,
+    "burst_padding": 1,
+    "heartbeat_interval": 10,
+    "keyframe_change": 0.05,
+    "frame_cache": "",
+    "frame_cache_size": 100000,
+    "header": True,
+    "checkpoint_interval": 30,
+    "resume": False,
+    "roi": "",
+    "mask_regions": "",
+    "auto_viewport": False,
+    "metrics": False,
+    "cprofile": False,
+    "live_size": "",
+    "live_fps": 30,
+    "live_queue": 4,
+    "live_timeout": 10,
+    "verbose": False,
+}
+
+def default_options(**changes):
+    """The analysis options, with any changes you give, e.g.
+    default_options(sample_rate=4). Command-line arguments work too."""
+    options = dict(DEFAULT_OPTIONS)
+    options.update(changes)
+    return argparse.Namespace(**options)
+
+def string_or_list(arg_value):
+    #If it's a single file, or a single directory name, keep it as is.
+    output = arg_value
+    if "," in arg_value:
+        output = arg_value.split(",")
+        # if the first character of the first file has [,
+        if output[0][0] == "[":
+            # get rid of it
+            output[0] = output[0][1:]
+        # if the last character of the last file has ],
+        if output[len(output)-1][-1] == "]":
+            # get rid of it.
+            output[len(output)-1] = output[len(output)-1][:-1]
+    return output
+
+def getFileNames(directory, extensions):
+    return [os.path.join(directory,f) for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)) and os.path.splitext(f)[1].lower() in extensions]
+
+def add_file_types(extensions, additional_types):
+    """Returns extensions, plus any additional_types (one, or a list) that the
+    user has given, e.g. "jpg" or ".jpg"."""
+    extensions = list(extensions)
+    # if the user specifies just 1 new extension, treat it like a list of 1.
+    if type(additional_types) != list:
+        additional_types = [additional_types] if len(additional_types) > 1 else []
+    # for any of the filetypes that the user has added,
+    for file_type in additional_types:
+        # if the user has just written "jpg", and not ".jpg",
+        if file_type[0] != ".":
+            # add that "." at the beginning of the extention.
+            temp_file_type = "." + file_type.lower()
+        else:
+            temp_file_type = file_type.lower()
+        # if we haven't seen this type before,
+        if temp_file_type not in extensions:
+            # add it to the list
+            extensions.append(temp_file_type)
+    return extensions
+
+def file_title(path):
+    # just extract the file component, for prettiness later on.
+    return os.path.basename(path).split("\\")[-1]
+
+
+############### SCREENSHOT FEATURES ###############
+
+# The secret sauce. Our template matches uses scale-invariant feature transform
+# (SIFT) to detect frames. ORB and AKAZE make binary features instead, which
+# are much quicker to calculate and compare (with the Hamming distance).
+# name: (how to make the detector, how to compare its features, settings)
+feature_backends = {
+    "sift": (lambda: cv2.SIFT_create(), "NORM_L1", "SIFT_create()"),
+    "orb": (lambda: cv2.ORB_create(nfeatures=1000), "NORM_HAMMING",
+            "ORB_create(nfeatures=1000)"),
+    # not in every build of OpenCV.
+    "akaze": (lambda: cv2.AKAZE_create(), "NORM_HAMMING", "AKAZE_create()"),
+}
+
+def create_feature_backend(name):
+    """Returns (detector, brute-force matcher, detector settings) for one of
+    the feature_backends."""
+    create_detector, norm, detector_settings = feature_backends[name]
+    try:
+        detector = create_detector()
+    except AttributeError:
+        raise ValueError("Your version of OpenCV doesn't have " + name +
+                         " features.")
+    return (detector, cv2.BFMatcher(getattr(cv2, norm), crossCheck=True),
+            detector_settings)
+
+def screenshot_cache_key(image_bytes, resize_factor, detector_settings):
+    """Screenshots only need their features recalculated if the image itself,
+    the resize factor or the detector changes."""
+    hasher = hashlib.sha1(image_bytes)
+    hasher.update("{}|{}".format(resize_factor, detector_settings).encode())
+    return hasher.hexdigest()
+
+def keypoints_to_array(keypoints):
+    return np.array([[kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response,
+                      kp.octave, kp.class_id] for kp in keypoints],
+                    np.float32).reshape(-1, 7)
+
+def array_to_keypoints(array):
+    return [cv2.KeyPoint(x=float(row[0]), y=float(row[1]), size=float(row[2]),
+                         angle=float(row[3]), response=float(row[4]),
+                         octave=int(row[5]), class_id=int(row[6]))
+            for row in array]
+
+def load_screen_descriptors(image_names, resize_factor, detector,
+                            detector_settings, cache_path=None, rebuild=False,
+                            verbose=True, mask_regions=None):
+    """Calculates the keypoints and descriptors of every app screenshot.
+
+    If a cache_path is given, features are read from (and saved to) a
+    compressed .npz file, so only new or changed screenshots are recalculated.
+    No features are found inside any of the mask_regions (see region_mask).
+    Returns ({image file: keypoints}, {image file: descriptors}).
+    """
+    cached = {}
+    if cache_path is not None and not rebuild and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cache_file:
+                cached = {name: cache_file[name] for name in cache_file.files}
+        except (OSError, ValueError): # a broken cache is just rebuilt.
+            cached = {}
+
+    full_keypoints = {}
+    full_descriptors = {}
+    to_save = {}
+    recalculated = 0
+    for image_path in tqdm(image_names, unit="images", disable=not verbose,
+                           bar_format="{l_bar}{bar}| {remaining} {rate_fmt} "):
+        image_file = file_title(image_path)
+        with open(image_path, "rb") as image_fp:
+            image_bytes = image_fp.read()
+        key = screenshot_cache_key(image_bytes, resize_factor,
+                                   detector_settings)
+        if key + "_kp" in cached and key + "_desc" in cached:
+            keypoint_array = cached[key + "_kp"]
+            descriptors = cached[key + "_desc"]
+        else:
+            recalculated += 1
+            # 2778, 1284 for iPhone 13 Pro Max
+            temp_image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8),
+                                      cv2.IMREAD_COLOR)
+            tiny_image = cv2.resize(temp_image, (0,0), fx=resize_factor,
+                                                       fy=resize_factor)
+            keypoints, descriptors = detector.detectAndCompute(
+                tiny_image, region_mask(tiny_image.shape[:2], mask_regions))
+            keypoint_array = keypoints_to_array(keypoints)
+            if descriptors is None: # no features on this screenshot.
+                descriptors = np.zeros((0, detector.descriptorSize()),
+                                       np.uint8 if detector.descriptorType() == cv2.CV_8U
+                                       else np.float32)
+        to_save[key + "_kp"] = keypoint_array
+        to_save[key + "_desc"] = descriptors
+        full_keypoints[image_file] = array_to_keypoints(keypoint_array)
+        full_descriptors[image_file] = descriptors if len(descriptors) else None
+
+    # only rewrite the cache if something has changed.
+    if cache_path is not None and (recalculated or set(to_save) != set(cached)):
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, "wb") as cache_file:
+            np.savez_compressed(cache_file, **to_save)
+        os.replace(temp_path, cache_path)
+    if verbose and cache_path is not None:
+        print("Recalculated features for {} of {} screenshots.".format(
+            recalculated, len(image_names)))
+    return full_keypoints, full_descriptors
+
+def build_page_index(full_descriptors):
+    """Puts every screenshot's features into one approximate nearest-neighbour
+    (FLANN KD-tree, or LSH for binary features) index, remembering which page
+    each feature came from."""
+    pages = list(full_descriptors.keys())
+    stacked_descriptors = []
+    labels = []
+    for label, page in enumerate(pages):
+        if full_descriptors[page] is None: # no features on this screenshot.
+            continue
+        stacked_descriptors.append(full_descriptors[page])
+        labels.append(np.full(len(full_descriptors[page]), label, np.int32))
+    all_descriptors = np.vstack(stacked_descriptors)
+    binary = all_descriptors.dtype == np.uint8
+    if binary:
+        index_params = dict(algorithm=6, table_number=6, key_size=12, # 6 = LSH
+                            multi_probe_level=1)
+    else:
+        index_params = dict(algorithm=1, trees=5) # 1 = KD-tree
+        all_descriptors = all_descriptors.astype(np.float32)
+    flann = cv2.FlannBasedMatcher(index_params, dict(checks=50))
+    flann.add([all_descriptors])
+    flann.train()
+    return {"matcher": flann, "labels": np.concatenate(labels),
+            "pages": pages, "binary": binary}
+
+def vote_for_page(full_frame_desc, page_index, ratio=0.8):
+    """Answers a frame with one k-nearest-neighbour query against the combined
+    index. Every frame feature votes for the page of its nearest screenshot
+    feature, unless the second nearest (from another page) is nearly as close.
+    """
+    pages = page_index["pages"]
+    if full_frame_desc is None: # a blank frame: there's nothing to vote with.
+        return [pages[0], 0]
+    if not page_index["binary"]:
+        full_frame_desc = full_frame_desc.astype(np.float32)
+    knn_matches = page_index["matcher"].knnMatch(full_frame_desc, k=2)
+    labels = page_index["labels"]
+    votes = []
+    for neighbours in knn_matches:
+        if len(neighbours) == 0:
+            continue
+        best = neighbours[0]
+        if len(neighbours) > 1:
+            second = neighbours[1]
+            # features that are shared between pages (e.g. a navigation bar)
+            # are ambiguous, so they don't get a vote.
+            if (labels[best.trainIdx] != labels[second.trainIdx] and
+                    best.distance >= ratio*second.distance):
+                continue
+        votes.append(labels[best.trainIdx])
+    page_votes = np.bincount(np.array(votes, np.int64),
+                             minlength=len(pages))
+    best_page = int(np.argmax(page_votes))
+    return [pages[best_page], int(page_votes[best_page])]
+
+def frame_thumbnail(frame, size=32):
+    """A tiny greyscale copy of a frame, which is quick to compare."""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, (size, size),
+                      interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def frame_has_changed(thumbnail, last_thumbnail, threshold):
+    """True if the average pixel (0-255) differs by more than the threshold."""
+    if last_thumbnail is None:
+        return True
+    return np.mean(np.abs(thumbnail - last_thumbnail)) > threshold
+
+def parse_regions(regions):
+    """"x,y,w,h;x,y,w,h" -> [(x, y, w, h), ...], where each number is a
+    fraction (0-1) of the image's width or height."""
+    if not regions:
+        return []
+    return [tuple(float(number) for number in region.split(","))
+            for region in regions.split(";") if region.strip()]
+
+def region_box(region, width, height):
+    """A fractional (x, y, w, h) region, in pixels: (left, top, right, bottom)."""
+    x, y, w, h = region
+    return (int(round(x*width)), int(round(y*height)),
+            int(round((x + w)*width)), int(round((y + h)*height)))
+
+def region_mask(shape, mask_regions):
+    """A detectAndCompute mask that ignores the mask_regions (e.g. a status
+    bar, or a notification banner), or None if there aren't any."""
+    if not mask_regions:
+        return None
+    height, width = shape
+    mask = np.full((height, width), 255, np.uint8)
+    for region in mask_regions:
+        left, top, right, bottom = region_box(region, width, height)
+        mask[top:bottom, left:right] = 0
+    return mask
+
+def find_viewport(frame, aspect, tolerance=24, min_fraction=0.1):
+    """Finds the app inside a frame, for recordings with letterboxing or a
+    device frame around it.
+
+    Any plain rows and columns around the edges (the same colour as the
+    corner, give or take compression noise) are trimmed off, and the rest
+    is cut down to the screenshots' aspect ratio (width/height). Extra height
+    is trimmed from the top, where status bars are, and extra width from
+    both sides.
+    Returns (left, top, right, bottom) in pixels, or None if what's left is
+    less than min_fraction of the frame's width or height (e.g. the frame
+    is blank, or a splash screen with a small logo).
+    """
+    grey = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    grey = grey.astype(np.int16)
+    border = grey[0, 0]
+    plain_rows = np.all(np.abs(grey - border) <= tolerance, axis=1)
+    plain_columns = np.all(np.abs(grey - border) <= tolerance, axis=0)
+    height, width = grey.shape
+    top, bottom, left, right = 0, height, 0, width
+    while top < bottom - 1 and plain_rows[top]:
+        top += 1
+    while bottom - 1 > top and plain_rows[bottom - 1]:
+        bottom -= 1
+    while left < right - 1 and plain_columns[left]:
+        left += 1
+    while right - 1 > left and plain_columns[right - 1]:
+        right -= 1
+
+    content_width, content_height = right - left, bottom - top
+    if content_width > aspect*content_height:
+        # too wide: keep the middle.
+        new_width = int(round(aspect*content_height))
+        left += (content_width - new_width)//2
+        right = left + new_width
+    else:
+        # too tall: keep the bottom.
+        top = bottom - int(round(content_width/aspect))
+    if right - left < min_fraction*width or bottom - top < min_fraction*height:
+        return None
+    return left, top, right, bottom
+
+def frame_viewport(frame, index, options):
+    """The part of the frame (left, top, right, bottom) that shows the app:
+    options.roi if it's given, the automatically found viewport with
+    options.auto_viewport, or None for the whole frame (including when the
+    viewport can't be found in this frame)."""
+    regions = parse_regions(options.roi)
+    if regions:
+        return region_box(regions[0], frame.shape[1], frame.shape[0])
+    if options.auto_viewport:
+        return find_viewport(frame, index.aspect)
+    return None
+
+def load_transition_graph(path, page_files):
+    """Counts how often users went from one page to another.
+
+    path is either a folder of csv files made by videoToMetricsConverter.py
+    (e.g. generated_metrics), or one csv file of "from page,to page,count"
+    rows. Returns {page file: {next page file: count}}, using the screenshot
+    filenames in page_files.
+    """
+    # the csv files use the page names without their extensions.
+    page_files_by_name = {page[:-4]: page for page in page_files}
+    graph = {}
+    def add(from_page, to_page, count):
+        if from_page in page_files_by_name and to_page in page_files_by_name:
+            successors = graph.setdefault(page_files_by_name[from_page], {})
+            to_file = page_files_by_name[to_page]
+            successors[to_file] = successors.get(to_file, 0) + count
+
+    if os.path.isdir(path):
+        for csv_path in getFileNames(path, [".csv"]):
+            with open(csv_path, "r", newline="") as csv_file:
+                # low confidence detections don't tell us anything.
+                visited = [row[0] for row in csv.reader(csv_file)
+                           if row and row[0] in page_files_by_name]
+            for i in range(len(visited)-1):
+                add(visited[i], visited[i+1], 1)
+    else:
+        with open(path, "r", newline="") as csv_file:
+            for row in csv.reader(csv_file):
+                if len(row) >= 2:
+                    try:
+                        count = float(row[2]) if len(row) > 2 else 1
+                    except ValueError: # a header
+                        continue
+                    add(row[0].strip(), row[1].strip(), count)
+    return graph
+
+def frame_signature(frame):
+    """A tiny summary of a frame's overall layout (a 16x16 greyscale
+    thumbnail) and colours (a hue/saturation histogram), which is far quicker
+    to compare than SIFT features."""
+    if frame.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (16, 16),
+                           interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    thumbnail -= thumbnail.mean()
+    thumbnail /= np.linalg.norm(thumbnail) + 1e-6
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, [8, 4],
+                             [0, 180, 0, 256]).ravel()
+    # square roots, so the distance between histograms is the Hellinger distance.
+    histogram = np.sqrt(histogram/(histogram.sum() + 1e-6))
+    return np.concatenate([thumbnail, histogram])
+
+def load_screen_signatures(image_names):
+    """Returns ([screenshot files], a matrix with one frame_signature per row)."""
+    pages = []
+    signatures = []
+    for image_path in image_names:
+        pages.append(file_title(image_path))
+        signatures.append(frame_signature(cv2.imread(image_path)))
+    return pages, np.array(signatures, np.float32)
+
+def shortlist_pages(frame, screen_signatures, top_k, max_distance=0):
+    """The top_k screenshots whose signatures are closest to the frame's.
+    Pages further away than max_distance are dropped too (if it's above 0),
+    but the closest page is always kept."""
+    pages, signatures = screen_signatures
+    distances = np.linalg.norm(signatures - frame_signature(frame), axis=1)
+    nearest = np.argsort(distances)[:top_k]
+    return [pages[i] for n, i in enumerate(nearest)
+            if n == 0 or max_distance <= 0 or distances[i] <= max_distance]
+
+def likely_pages(previous_page, transition_graph, successors=3):
+    """The previous page, followed by the pages most often visited after it."""
+    if previous_page is None:
+        return None
+    next_pages = transition_graph.get(previous_page, {})
+    next_pages = sorted(next_pages, key=lambda page: next_pages[page])[::-1]
+    return [previous_page] + [page for page in next_pages
+                              if page != previous_page][:successors]
+
+
+################## INSTRUMENTATION ##################
+
+class Metrics:
+    """Counters, and histograms of how long each step took, for one video.
+
+    Histograms count how many times fell into each bucket (in seconds), like
+    Prometheus's, so they stay the same size however long the video is.
+    """
+    buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+               0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+    def __init__(self):
+        self.counters = {} # name -> total
+        # (name, page or None) -> [count per bucket (and one for +Inf), sum, max]
+        self.histograms = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds, page=None):
+        key = (name, page)
+        if key not in self.histograms:
+            self.histograms[key] = [[0]*(len(self.buckets) + 1), 0.0, 0.0]
+        histogram = self.histograms[key]
+        bucket = 0
+        while bucket < len(self.buckets) and seconds > self.buckets[bucket]:
+            bucket += 1
+        histogram[0][bucket] += 1
+        histogram[1] += seconds
+        histogram[2] = max(histogram[2], seconds)
+
+    def merge(self, other):
+        """Adds another Metrics' counts to this one (e.g. from a segment)."""
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        for key, (counts, total, longest) in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = [[0]*(len(self.buckets) + 1), 0.0, 0.0]
+            histogram = self.histograms[key]
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+            histogram[2] = max(histogram[2], longest)
+
+    def to_dict(self):
+        histograms = []
+        for (name, page), (counts, total, longest) in sorted(
+                self.histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            cumulative = np.cumsum(counts)
+            histograms.append({
+                "name": name, "page": page, "count": int(cumulative[-1]),
+                "sum_seconds": total, "mean_seconds": total/max(cumulative[-1], 1),
+                "max_seconds": longest,
+                "buckets": {str(le): int(n) for le, n in
+                            zip(list(self.buckets) + ["+Inf"], cumulative)}})
+        return {"counters": dict(self.counters), "histograms": histograms}
+
+    def to_prometheus(self, video, prefix="user_testing_tool"):
+        """The metrics in Prometheus's textfile format."""
+        video = video.replace("\\", "\\\\").replace('"', '\\"')
+        lines = []
+        for name in sorted(self.counters):
+            lines.append("# TYPE {}_{}_total counter".format(prefix, name))
+            lines.append('{}_{}_total{{video="{}"}} {}'.format(
+                prefix, name, video, self.counters[name]))
+        typed = set()
+        for histogram in self.to_dict()["histograms"]:
+            metric = "{}_{}_seconds".format(prefix, histogram["name"])
+            if metric not in typed:
+                lines.append("# TYPE {} histogram".format(metric))
+                typed.add(metric)
+            labels = 'video="{}"'.format(video)
+            if histogram["page"] is not None:
+                labels += ',page="{}"'.format(histogram["page"])
+            for le, n in histogram["buckets"].items():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels,
+                                                                le, n))
+            lines.append("{}_sum{{{}}} {}".format(metric, labels,
+                                                  histogram["sum_seconds"]))
+            lines.append("{}_count{{{}}} {}".format(metric, labels,
+                                                    histogram["count"]))
+        return "\n".join(lines) + "\n"
+
+    def save(self, filepath, video):
+        """Writes <filepath>.metrics.json and <filepath>.prom."""
+        report = {"video": video}
+        report.update(self.to_dict())
+        with open(filepath + ".metrics.json", "w") as report_file:
+            json.dump(report, report_file, indent=4)
+        with open(filepath + ".prom", "w") as report_file:
+            report_file.write(self.to_prometheus(video))
+
+class InstrumentedCapture:
+    """Stands in for a cv2.VideoCapture, timing every read, grab, retrieve,
+    set and get call (as video_read_seconds, and so on)."""
+    timed_calls = ("read", "grab", "retrieve", "set", "get")
+
+    def __init__(self, video, metrics):
+        self.video = video
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        call = getattr(self.video, name)
+        if name not in self.timed_calls:
+            return call
+        def timed_call(*args):
+            start = time.perf_counter()
+            result = call(*args)
+            self.metrics.observe("video_" + name, time.perf_counter() - start)
+            return result
+        return timed_call
+
+def open_video(video_name, metrics=None):
+    """cv2.VideoCapture, timed if there are metrics to fill in."""
+    video = cv2.VideoCapture(video_name) # loading the video up.
+    if metrics is not None:
+        return InstrumentedCapture(video, metrics)
+    return video
+
+def print_profile(profiler, filepath, lines=15):
+    """Saves a cProfile profile (or merged pstats.Stats, for snakeviz or
+    pstats), and prints the functions that took the longest."""
+    profiler.dump_stats(filepath)
+    print("Profile saved to " + filepath)
+    stats = (profiler if isinstance(profiler, pstats.Stats)
+             else pstats.Stats(profiler))
+    stats.sort_stats("cumulative").print_stats(lines)
+
+
+class ScreenIndex:
+    """Every app screenshot's features, ready to match video frames against.
+
+    Build it once (e.g. with ScreenIndex.from_screenshots) and reuse it for as
+    many videos as you like.
+    """
+    def __init__(self, full_descriptors, features="sift", resize_factor=0.25,
+                 matcher="brute", flann_ratio=0.8, mask_regions=None):
+        # {screenshot file: descriptors}
+        self.full_descriptors = full_descriptors
+        self.features = features
+        self.resize_factor = resize_factor
+        self.matcher = matcher
+        self.flann_ratio = flann_ratio
+        self.detector, self.bf_match, self.detector_settings = \
+            create_feature_backend(features)
+        # without crossCheck, so the transition prior can use the ratio test.
+        self.ratio_match = cv2.BFMatcher(getattr(cv2, feature_backends[features][1]))
+        self.page_index = (build_page_index(full_descriptors)
+                           if matcher == "flann" else None)
+        # fractional (x, y, w, h) regions of the app that we ignore.
+        self.mask_regions = mask_regions or []
+        self.frame_masks = {} # one mask per frame size
+        # {stage: [seconds, ...]}, if you'd like to know where the time goes.
+        self.timings = None
+        # a Metrics, while a video's being instrumented.
+        self.metrics = None
+        # optional: for the cascade, the transition prior and auto_viewport.
+        self.screen_signatures = None
+        self.transition_graph = None
+        self.aspect = None
+
+    @classmethod
+    def from_screenshots(cls, image_names, resize_factor=0.25, features="sift",
+                         matcher="brute", flann_ratio=0.8, cache_path=None,
+                         rebuild_cache=False, verbose=False, mask_regions=None):
+        """image_names is a list of screenshot files, or a folder of them.
+        mask_regions (e.g. parse_regions("0,0,1,0.05")) are ignored in the
+        screenshots and in every frame."""
+        if type(image_names) == str:
+            image_names = getFileNames(image_names, image_extensions)
+        detector, _, detector_settings = create_feature_backend(features)
+        if mask_regions:
+            # masked features are different features.
+            detector_settings += " mask=" + str(mask_regions)
+        _, full_descriptors = load_screen_descriptors(
+            image_names, resize_factor, detector, detector_settings,
+            cache_path, rebuild_cache, verbose, mask_regions)
+        index = cls(full_descriptors, features, resize_factor, matcher,
+                    flann_ratio, mask_regions)
+        index.image_names = image_names
+        return index
+
+    @property
+    def pages(self):
+        """The screenshot filenames, e.g. "home.png"."""
+        return list(self.full_descriptors.keys())
+
+    @property
+    def page_names(self):
+        """The page names used in the csv files, e.g. "home"."""
+        return [page[:-4] for page in self.full_descriptors.keys()]
+
+    def load_signatures(self, image_names=None):
+        """Lets the index shortlist pages by their thumbnails and colours."""
+        self.screen_signatures = load_screen_signatures(
+            image_names if image_names is not None else self.image_names)
+
+    def load_transition_graph(self, path):
+        """Lets the index try the pages a user is likely to visit next first."""
+        self.transition_graph = load_transition_graph(path, self.pages)
+
+    def load_aspect(self, image_names=None):
+        """Remembers the screenshots' (median) aspect ratio, for find_viewport."""
+        aspects = []
+        for image_path in (image_names if image_names is not None
+                           else self.image_names):
+            # a quarter size copy is plenty to measure the shape.
+            height, width = cv2.imread(image_path,
+                                       cv2.IMREAD_REDUCED_GRAYSCALE_4).shape
+            aspects.append(width/height)
+        self.aspect = float(np.median(aspects))
+
+    def shrink(self, frame, viewport=None, resize=True):
+        """Crops a frame down to its viewport (from frame_viewport), and
+        shrinks it by the resize factor (unless the decoder already has),
+        ready for detect_page."""
+        start = time.perf_counter()
+        if viewport is not None:
+            left, top, right, bottom = viewport
+            frame = frame[top:bottom, left:right]
+        if not resize:
+            self.record("resize", start)
+            return frame
+        tiny_frame = cv2.resize(frame, (0,0), fx=self.resize_factor,
+                                              fy=self.resize_factor)
+        self.record("resize", start)
+        return tiny_frame
+
+    def record(self, stage, start, page=None):
+        # if someone's timing us (e.g. benchmarkSuite.py, or the metrics),
+        # note how long this stage took.
+        if self.timings is not None:
+            self.timings.setdefault(stage, []).append(time.perf_counter() - start)
+        if self.metrics is not None:
+            self.metrics.observe(stage, time.perf_counter() - start, page)
+
+    def frame_mask(self, shape):
+        if not self.mask_regions:
+            return None
+        if shape not in self.frame_masks:
+            self.frame_masks[shape] = region_mask(shape, self.mask_regions)
+        return self.frame_masks[shape]
+
+    def detect_page(self, frame, candidates=None, margin=0, stats=None,
+                    pages=None):
+        """Finds the screenshot with the most feature matches to the frame.
+
+        If candidates are given (e.g. from likely_pages), those pages are matched
+        first, and the rest are only matched if the best of them doesn't have
+        at least margin distinctive matches (see confident_matches).
+        If pages are given (e.g. from shortlist_pages), only those are matched.
+        Returns [page, number of matches].
+        """
+        start = time.perf_counter()
+        _, full_frame_desc = self.detector.detectAndCompute(
+            frame, self.frame_mask(frame.shape[:2]))
+        self.record("detect_and_compute", start)
+        if self.metrics is not None:
+            self.metrics.count("keypoints", 0 if full_frame_desc is None
+                                            else len(full_frame_desc))
+        start = time.perf_counter()
+        page_and_confidence = self.match_page(full_frame_desc, candidates,
+                                              margin, stats, pages)
+        self.record("match", start)
+        return page_and_confidence
+
+    def match_page(self, full_frame_desc, candidates=None, margin=0,
+                   stats=None, pages=None):
+        """The matching half of detect_page, for a frame's descriptors."""
+        if self.page_index is not None:
+            return vote_for_page(full_frame_desc, self.page_index,
+                                 self.flann_ratio)
+        full_descriptors = self.full_descriptors
+        if full_frame_desc is None: # a blank frame: there's nothing to match.
+            return [(pages or list(full_descriptors.keys()))[0], 0]
+        scores = {}
+        if candidates:
+            for page in candidates:
+                scores[page] = self.count_matches(page, full_frame_desc)
+            best = max([[page, scores[page]] for page in candidates],
+                       key = lambda x: x[1])
+            # the raw number of matches isn't enough: wrong pages still get
+            # plenty, they're just not very distinctive ones.
+            if self.confident_matches(best[0], full_frame_desc) >= margin:
+                if stats is not None:
+                    stats["pruned"] += 1
+                return best
+        if pages is None:
+            pages = full_descriptors.keys()
+        for page in pages:
+            if page not in scores:
+                scores[page] = self.count_matches(page, full_frame_desc)
+        full_frame_scores = [[page, scores[page]] for page in pages]
+
+        full_frame_scores = sorted(full_frame_scores, key = lambda x: x[1])[::-1]
+        # clear memory
+        full_frame_desc = None
+        return full_frame_scores[0]
+
+    def count_matches(self, page, full_frame_desc):
+        """How many of a page's features match the frame's."""
+        start = time.perf_counter()
+        full_matches = self.bf_match.match(self.full_descriptors[page],
+                                           full_frame_desc)
+        if self.metrics is not None:
+            self.metrics.observe("bf_match", time.perf_counter() - start, page)
+        return len(full_matches)
+
+    def confident_matches(self, page, full_frame_desc, ratio=0.75):
+        """How many of a page's features clearly match one of the frame's
+        (Lowe's ratio test): the nearest is much nearer than the next nearest."""
+        if self.full_descriptors[page] is None or len(full_frame_desc) < 2:
+            return 0
+        pairs = self.ratio_match.knnMatch(self.full_descriptors[page],
+                                          full_frame_desc, k=2)
+        return sum(1 for pair in pairs
+                   if len(pair) == 2 and pair[0].distance < ratio*pair[1].distance)
+
+    def signature(self):
+        """Changes whenever the screenshots do, or how they're described and
+        matched does, so saved answers (in a FrameCache) can be thrown away."""
+        hasher = hashlib.sha1("{}|{}|{}|{}|{}|{}".format(
+            self.features, self.detector_settings, self.matcher,
+            self.flann_ratio, self.resize_factor, self.mask_regions).encode())
+        for page in self.pages:
+            hasher.update(page.encode())
+            if self.full_descriptors[page] is not None:
+                hasher.update(np.ascontiguousarray(self.full_descriptors[page]))
+        return hasher.hexdigest()
+
+    def share(self, directory):
+        """Saves every screenshot's descriptors into one .npy file, so that
+        worker processes can memory-map them instead of receiving their own
+        copy. Returns what ScreenIndex.from_shared needs to rebuild the index."""
+        pages = self.pages
+        stacked_descriptors = [self.full_descriptors[page] for page in pages
+                               if self.full_descriptors[page] is not None]
+        offsets = [0]
+        for page in pages:
+            descriptors = self.full_descriptors[page]
+            offsets.append(offsets[-1] + (0 if descriptors is None else len(descriptors)))
+        path = os.path.join(directory, "screen_descriptors.npy")
+        np.save(path, np.vstack(stacked_descriptors))
+        return {"path": path, "pages": pages, "offsets": offsets,
+                "features": self.features, "resize_factor": self.resize_factor,
+                "matcher": self.matcher, "flann_ratio": self.flann_ratio,
+                "mask_regions": self.mask_regions, "aspect": self.aspect,
+                "screen_signatures": self.screen_signatures,
+                "transition_graph": self.transition_graph}
+
+    @classmethod
+    def from_shared(cls, shared):
+        all_descriptors = np.load(shared["path"], mmap_mode="r")
+        offsets = shared["offsets"]
+        full_descriptors = {}
+        for i, page in enumerate(shared["pages"]):
+            if offsets[i+1] > offsets[i]:
+                full_descriptors[page] = all_descriptors[offsets[i]:offsets[i+1]]
+            else:
+                full_descriptors[page] = None
+        index = cls(full_descriptors, shared["features"],
+                    shared["resize_factor"], shared["matcher"],
+                    shared["flann_ratio"], shared["mask_regions"])
+        index.aspect = shared["aspect"]
+        index.screen_signatures = shared["screen_signatures"]
+        index.transition_graph = shared["transition_graph"]
+        return index
+
+
+################## FRAME CACHE ####################
+
+def frame_fingerprint(frame, size=16):
+    """A difference hash of a (shrunk) frame: whether each pixel of a tiny
+    greyscale copy is brighter than the one to its left. The same screen
+    gets the same fingerprint, even in another session's recording."""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(frame, (size + 1, size),
+                           interpolation=cv2.INTER_AREA).astype(np.int16)
+    # small differences (e.g. from compression) don't count.
+    return np.packbits(thumbnail[:, 1:] - thumbnail[:, :-1] > 2).tobytes()
+
+class FrameCache:
+    """Remembers the [page, number of matches] of every frame fingerprint,
+    in a SQLite database, so a screen that's been seen before (in any video,
+    by any worker) doesn't need detecting again.
+
+    Only the answers of full searches are saved, so with the cascade
+    (cascade_top_k) nothing is added unless cascade_validate runs the full
+    search too (and frames matched by the transition prior need prior_validate).
+    It keeps the max_entries most recently used fingerprints. signature comes
+    from ScreenIndex.signature, and if it's changed (e.g. a screenshot was
+    updated), everything saved so far is forgotten.
+    """
+    def __init__(self, path, signature, max_entries=100000):
+        self.max_entries = max_entries
+        # we handle the transactions ourselves (see flush).
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # other workers can keep reading while one writes.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta "
+                                "(key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS frames "
+                                "(fingerprint BLOB PRIMARY KEY, page TEXT, "
+                                "matches INTEGER, last_used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS frames_last_used "
+                                "ON frames (last_used)")
+        stored = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        if stored is None or stored[0] != signature:
+            self.connection.execute("DELETE FROM frames")
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES "
+                                    "('signature', ?)", (signature,))
+        self.connection.execute("COMMIT")
+        self.hits = 0
+        self.lookups = 0
+        self.new_answers = {} # fingerprint: (fingerprint, page, matches, time)
+        self.used = []
+
+    def lookup(self, fingerprint):
+        """The saved [page, number of matches] for a fingerprint, or None."""
+        self.lookups += 1
+        if fingerprint in self.new_answers: # not saved yet.
+            self.hits += 1
+            return list(self.new_answers[fingerprint][1:3])
+        answer = self.connection.execute(
+            "SELECT page, matches FROM frames WHERE fingerprint = ?",
+            (fingerprint,)).fetchone()
+        if answer is None:
+            return None
+        self.hits += 1
+        self.used.append((time.time(), fingerprint))
+        if len(self.new_answers) + len(self.used) >= 64:
+            self.flush()
+        return list(answer)
+
+    def store(self, fingerprint, page_and_confidence):
+        self.new_answers[fingerprint] = (fingerprint, page_and_confidence[0],
+                                         int(page_and_confidence[1]),
+                                         time.time())
+        if len(self.new_answers) + len(self.used) >= 64:
+            self.flush()
+
+    def flush(self):
+        """Saves the new answers (and which old ones were used), and forgets
+        the least recently used fingerprints if there are too many."""
+        if not self.new_answers and not self.used:
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.executemany("INSERT OR REPLACE INTO frames VALUES "
+                                    "(?, ?, ?, ?)",
+                                    list(self.new_answers.values()))
+        self.connection.executemany("UPDATE frames SET last_used = ? "
+                                    "WHERE fingerprint = ?", self.used)
+        extra = self.connection.execute(
+            "SELECT COUNT(*) FROM frames").fetchone()[0] - self.max_entries
+        if extra > 0:
+            self.connection.execute(
+                "DELETE FROM frames WHERE fingerprint IN (SELECT fingerprint "
+                "FROM frames ORDER BY last_used LIMIT ?)", (extra,))
+        self.connection.execute("COMMIT")
+        self.new_answers = {}
+        self.used = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+################# READING VIDEOS ##################
+
+def seek_frames(video, sampling_interval, stats):
+    """Jumps the video's play head to every frame that we want to analyse.
+
+    Every jump makes the decoder go back to the last keyframe and decode
+    forwards again, so this is only quick when frames are far apart.
+    Yields (frame, time in milliseconds, frame position) for each sample.
+    """
+    # This is our "play head". We haven't seen any frames of the video,
+    # so it's at 0.
+    duration = 0
+    total_frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    current_frame = 0
+    frame = 'the first frame'
+    while current_frame < total_frame_count and frame is not None:
+        start = time.perf_counter()
+        ret, frame = video.read()
+        # most videos don't have EXACT integer frame rates, so this finds the
+        # closest next frame to analyse.
+        current_time = video.get(cv2.CAP_PROP_POS_MSEC)
+        stats["decode_seconds"] += time.perf_counter() - start
+        if frame is None:
+            break
+        stats["frames_decoded"] += 1
+        yield frame, current_time, current_frame
+
+        # move our "play head", onto the next frame for analysis
+        start = time.perf_counter()
+        duration += sampling_interval
+        video.set(cv2.CAP_PROP_POS_MSEC, duration)
+        current_frame = video.get(cv2.CAP_PROP_POS_FRAMES)
+        stats["decode_seconds"] += time.perf_counter() - start
+        stats["frames_covered"] = current_frame
+
+def sequential_frames(video, sampling_interval, stats, start_frame=0,
+                      end_frame=None):
+    """Reads through the video once, from start to finish.
+
+    grab() moves past frames without converting them into images, and only
+    the frames that land on (or just after) a sampling point are retrieve()d.
+    The timestamps come from the video stream itself.
+    A frame is analysed if a sampling point falls between its timestamp and
+    the timestamp of the frame before it, so reading just the frames from
+    start_frame up to (not including) end_frame gives exactly the samples
+    that reading the whole video would have given for that range.
+    Yields (frame, time in milliseconds, frame position) for each sample.
+    """
+    next_sample = 0
+    current_frame = 0
+    start = time.perf_counter()
+    if start_frame > 0:
+        # seek once, to the frame just before our range, so we know
+        # where the previous sampling point was.
+        video.set(cv2.CAP_PROP_POS_FRAMES, start_frame - 1)
+        if video.grab():
+            previous_time = video.get(cv2.CAP_PROP_POS_MSEC)
+            next_sample = (previous_time // sampling_interval + 1) * sampling_interval
+        current_frame = start_frame
+    while (end_frame is None or current_frame < end_frame) and video.grab():
+        current_frame += 1
+        current_time = video.get(cv2.CAP_PROP_POS_MSEC)
+        if current_time >= next_sample:
+            ret, frame = video.retrieve()
+            stats["decode_seconds"] += time.perf_counter() - start
+            if ret:
+                stats["frames_decoded"] += 1
+                stats["frames_covered"] = current_frame
+                yield frame, current_time, current_frame
+            # the next sampling point after this frame.
+            next_sample = (current_time // sampling_interval + 1) * sampling_interval
+            start = time.perf_counter()
+    stats["decode_seconds"] += time.perf_counter() - start
+    stats["frames_covered"] = current_frame
+
+def ffmpeg_frames(video_name, video, sample_rate, resize_factor, stats,
+                  gray=False):
+    """Lets ffmpeg do the sampling and the shrinking, so full size frames
+    never leave the decoder.
+
+    ffmpeg's fps filter keeps sample_rate frames per second, its scale filter
+    shrinks them by resize_factor (the same size that cv2.resize would make),
+    and it sends them to us as raw bgr24 (or, if gray is set, 8 bit
+    greyscale) pixels. video is the cv2.VideoCapture of the same file, which
+    we only ask how big the frames are.
+    Every frame is read into the same array, so each one is only valid until
+    the next is read (which is all that detect_page needs).
+    Yields (frame, time in milliseconds, frame position) for each sample.
+    """
+    width = round(video.get(cv2.CAP_PROP_FRAME_WIDTH)*resize_factor)
+    height = round(video.get(cv2.CAP_PROP_FRAME_HEIGHT)*resize_factor)
+    video_fps = video.get(cv2.CAP_PROP_FPS) or 30
+    channels = 1 if gray else 3
+    frame = np.empty((height, width, channels) if channels == 3
+                     else (height, width), np.uint8)
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-i", video_name,
+               "-an", "-sn",
+               "-vf", "fps={},scale={}:{}:flags=area".format(sample_rate,
+                                                            width, height),
+               "-f", "rawvideo", "-pix_fmt", "gray" if gray else "bgr24", "-"]
+    # ffmpeg's messages go to a file, not a pipe: if a pipe filled up (e.g.
+    # with warnings about a damaged recording), ffmpeg would wait for us to
+    # read it, while we wait for the next frame.
+    error_file = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=error_file)
+    except FileNotFoundError:
+        error_file.close()
+        raise RuntimeError("decode_mode ffmpeg needs ffmpeg to be installed.")
+    buffer = memoryview(frame).cast("B")
+    sample = 0
+    finished = False
+    try:
+        while True:
+            start = time.perf_counter()
+            size = process.stdout.readinto(buffer)
+            stats["decode_seconds"] += time.perf_counter() - start
+            if size < len(buffer): # the video has ended.
+                finished = True
+                break
+            current_time = sample*1000/sample_rate
+            position = round(current_time/1000*video_fps)
+            sample += 1
+            stats["frames_decoded"] += 1
+            stats["frames_covered"] = position
+            yield frame, current_time, position
+    finally:
+        process.stdout.close()
+        if not finished: # we stopped early.
+            process.kill()
+        return_code = process.wait()
+        error_file.seek(0)
+        # the last few messages are the ones that explain what went wrong.
+        error = error_file.read().decode(errors="replace")[-2000:]
+        error_file.close()
+        if finished and return_code != 0:
+            raise RuntimeError("ffmpeg couldn't read " + video_name + ": " + error)
+    stats["frames_covered"] = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+def read_packets(video_name):
+    """The (time in milliseconds, size in bytes, keyframe or not) of every
+    packet in a video, straight from the container, without decoding any
+    of them."""
+    video = cv2.VideoCapture(video_name)
+    # -1 makes read() hand us the encoded packets, instead of frames.
+    if not video.set(cv2.CAP_PROP_FORMAT, -1):
+        video.release()
+        raise RuntimeError("This OpenCV can't read the packets of " + video_name)
+    packets = []
+    while True:
+        ret, packet = video.read()
+        if not ret:
+            break
+        packets.append((video.get(cv2.CAP_PROP_POS_MSEC), packet.size,
+                        video.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0))
+    video.release()
+    return packets
+
+def transition_windows(packets, sampling_interval, burst_factor=4, padding=1,
+                       heartbeat=10, history=20, keyframe_change=0.05):
+    """Works out which parts of a video need decoding, from its packets.
+
+    A static screen is encoded as tiny packets, and a change of screen as a
+    burst of big ones. So the packets are added up for every sampling
+    interval, and an interval that's more than burst_factor times the median
+    of the last history intervals (or, near the start, of the whole video) is
+    a likely transition. So is a keyframe whose size changes by more than the
+    keyframe_change fraction from the one before, or that comes sooner than
+    usual (encoders add keyframes when the picture changes).
+    We sample padding seconds either side of each one, and once every
+    heartbeat seconds (in case a transition was missed), plus the start and
+    end.
+    Returns [(first frame, last frame, sampling points in milliseconds)],
+    where the first frame is a keyframe (or the very first frame, if none of
+    the packets are marked as keyframes), so decoding can start there.
+    """
+    if not packets:
+        return []
+    # packets are stored in decoding order, which isn't always the order
+    # they're shown in.
+    packets = sorted(packets)
+    times = [packet[0] for packet in packets]
+    video_length = times[-1]
+    ranges = [(0, sampling_interval), (video_length - sampling_interval,
+                                       video_length + 1)]
+    ranges += [(beat, beat + sampling_interval) for beat in
+               range(0, int(video_length), max(int(heartbeat*1000), 1))]
+    padding = max(padding*1000, sampling_interval)
+
+    keyframes = [position for position, packet in enumerate(packets)
+                 if packet[2]]
+    longest_gap = 0
+    for previous, keyframe in zip(keyframes, keyframes[1:]):
+        previous_size, size = packets[previous][1], packets[keyframe][1]
+        if (keyframe - previous < longest_gap or
+                abs(size - previous_size) > previous_size*keyframe_change):
+            ranges.append((times[keyframe] - padding, times[keyframe] + padding))
+        longest_gap = max(longest_gap, keyframe - previous)
+
+    interval_sizes = [0]*(int(video_length // sampling_interval) + 1)
+    for packet_time, size, keyframe in packets:
+        if not keyframe:
+            interval_sizes[int(packet_time // sampling_interval)] += size
+    # until there are history intervals to go on, compare with the whole video.
+    overall = sorted(interval_sizes)[len(interval_sizes)//2]
+    for interval, size in enumerate(interval_sizes):
+        if interval >= history:
+            recent = sorted(interval_sizes[interval - history:interval])
+            typical = recent[len(recent)//2]
+        else:
+            typical = overall
+        if size > burst_factor*max(typical, 1):
+            start = interval*sampling_interval
+            ranges.append((start - padding, start + sampling_interval + padding))
+
+    # the sampling points (the same ones the sequential mode would use) in
+    # each range, and the frames that land on them.
+    windows = []
+    for start, end in sorted(ranges):
+        first_point = max(-(-start // sampling_interval), 0)*sampling_interval
+        points = [first_point + i*sampling_interval for i in
+                  range(int(max(end - first_point, 0) // sampling_interval) + 1)]
+        points = [point for point in points if point < end and
+                  point <= video_length]
+        if not points:
+            continue
+        first = bisect.bisect_left(times, points[0])
+        last = min(bisect.bisect_left(times, points[-1]), len(times) - 1)
+        # decoding has to start from a keyframe (or from the very start).
+        if keyframes:
+            first = keyframes[max(bisect.bisect_right(keyframes, first) - 1, 0)]
+        else:
+            first = 0
+        if windows and first <= windows[-1][1] + 1:
+            # it overlaps the window before, so read straight on.
+            previous_first, previous_last, previous_points = windows[-1]
+            windows[-1] = (previous_first, max(previous_last, last),
+                           sorted(set(previous_points + points)))
+        else:
+            windows.append((first, last, points))
+    return windows
+
+def packet_frames(video, windows, stats):
+    """Only decodes the windows of the video from transition_windows.
+    Jumps to the keyframe at the start of each window, and reads on from
+    there, analysing the first frame at (or just after) each sampling point.
+    stats["frames_read"] counts every frame that was decoded.
+    Yields (frame, time in milliseconds, frame position) for each sample.
+    """
+    stats.setdefault("frames_read", 0)
+    stats["windows"] = len(windows)
+    position = 0 # the frame that grab() reads next
+    for first, last, points in windows:
+        start = time.perf_counter()
+        if first != position:
+            video.set(cv2.CAP_PROP_POS_FRAMES, first)
+            position = first
+        points = iter(points)
+        next_sample = next(points)
+        while (position <= last and next_sample is not None and
+               video.grab()):
+            position += 1
+            stats["frames_read"] += 1
+            current_time = video.get(cv2.CAP_PROP_POS_MSEC)
+            if current_time >= next_sample:
+                ret, frame = video.retrieve()
+                stats["decode_seconds"] += time.perf_counter() - start
+                if ret:
+                    stats["frames_decoded"] += 1
+                    stats["frames_covered"] = position
+                    yield frame, current_time, position
+                # the next sampling point after this frame.
+                next_sample = next((point for point in points
+                                    if point > current_time), None)
+                start = time.perf_counter()
+        stats["decode_seconds"] += time.perf_counter() - start
+    stats["frames_covered"] = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+frame_sources = {"sequential": sequential_frames, "seek": seek_frames}
+# ffmpeg_frames and packet_frames need more than the frame_sources do, so
+# they're kept separate.
+decode_modes = list(frame_sources) + ["ffmpeg", "packets"]
+
+
+#################### TIMELINES ####################
+
+low_confidence = "low confidence detection    "
+
+def clean_rows(samples, feature_cutoff, state=None):
+    """Turns [[page, confidence], seconds] samples into [page, time taken,
+    cumulative time] rows, one per visit to a page.
+
+    This is a generator: each row comes out as soon as the next page is
+    detected (and the last row once the samples run out), so a video's rows
+    can be written as it's analysed. The page being visited (and when it
+    started) is kept in state, so cleaning can carry on where it left off.
+    """
+    if state is None:
+        state = {}
+    for sample in samples:
+        # if there's any pages with fewer than (default=10) keypoints,
+        # give their labels a "low confident detection"
+        page = sample[0][0] if sample[0][1] > feature_cutoff else low_confidence
+        current_time = sample[1]
+        # the first page that we detect in the video.
+        if state.get("page") is None:
+            state["page"], state["start"] = page, 0
+        # if we have a low confidence detection, ignore it.
+        # if the current page is different from the most recent one seen,
+        elif page != low_confidence and page != state["page"]:
+            row = [state["page"][:-4], current_time - state["start"],
+                   current_time]
+            state["page"], state["start"] = page, current_time
+            yield row
+        state["time"] = current_time
+    if state.get("page") is not None:
+        yield [state["page"][:-4], state["time"] - state["start"],
+               state["time"]]
+
+def clean_timeline(timeline, feature_cutoff):
+    """The rows of clean_rows, as a list."""
+    ### CLEANING UP THE TIMELINE ###
+    return list(clean_rows(timeline, feature_cutoff))
+
+csv_header = ['Screen_Title','Time_Taken_(Seconds)','Cumulative_Time_(Seconds)']
+
+def write_timeline_csv(timeline_cleaned, filepath, header=True):
+    ### WRITING TO A FILE ###
+    with open(filepath, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        if header == True:
+            # write a header.
+            writer.writerow(csv_header)
+        for row in timeline_cleaned:
+            writer.writerow(row)
+
+
+class Timeline:
+    """The page detected in every analysed frame of a video, and when."""
+    def __init__(self, video_name, samples=None, metadata=None, metrics=None,
+                 profile=None):
+        self.video_name = video_name
+        # [[page, confidence], seconds] for every analysed frame.
+        self.samples = samples if samples is not None else []
+        # how the timeline was made (e.g. which features were used).
+        self.metadata = metadata if metadata is not None else {}
+        # optional: how long each step took (a Metrics), and a cProfile.Profile
+        # (or, from segments, a pstats.Stats).
+        self.metrics = metrics
+        self.profile = profile
+
+    def __len__(self):
+        return len(self.samples)
+
+    def cleaned(self, feature_cutoff=10):
+        """[page, time taken, cumulative time] rows, one per visit to a page."""
+        if len(self.samples) == 0:
+            raise ValueError("Couldn't read any frames from " + self.video_name)
+        return clean_timeline(self.samples, feature_cutoff)
+
+    @property
+    def csv_title(self):
+        return "timings-" + file_title(self.video_name)[:-4] + ".csv"
+
+    def save(self, output_folder_path, options=None):
+        """Writes the cleaned timeline to a csv file (and how it was made to a
+        .json file next to it). Returns the path of the csv file."""
+        if options is None:
+            options = default_options()
+        os.makedirs(output_folder_path, exist_ok=True)
+        filepath = os.path.join(output_folder_path, self.csv_title)
+        write_timeline_csv(self.cleaned(options.feature_cutoff), filepath,
+                           options.header)
+        metadata = dict(self.metadata)
+        metadata["feature_cutoff"] = options.feature_cutoff
+        with open(filepath[:-4] + ".json", "w") as metadata_file:
+            json.dump(metadata, metadata_file, indent=4)
+        if self.metrics is not None:
+            self.metrics.save(filepath[:-4], file_title(self.video_name))
+        if self.profile is not None:
+            if options.verbose:
+                print_profile(self.profile, filepath[:-4] + ".prof")
+            else:
+                self.profile.dump_stats(filepath[:-4] + ".prof")
+        return filepath
+
+
+################ ANALYSING VIDEOS #################
+
+def run_metadata(index, options):
+    """How a timeline was made (e.g. which features were used)."""
+    metadata = {"features": index.features,
+                "detector_settings": index.detector_settings,
+                "matcher": index.matcher,
+                "sample_rate": options.sample_rate,
+                "adaptive": options.adaptive,
+                "resize_factor": index.resize_factor,
+                "roi": options.roi,
+                "auto_viewport": options.auto_viewport,
+                "mask_regions": options.mask_regions,
+                "feature_cutoff": options.feature_cutoff,
+                "change_threshold": options.change_threshold,
+                "decode_mode": options.decode_mode,
+                "opencv_version": cv2.__version__}
+    if options.decode_mode == "ffmpeg":
+        # only ffmpeg can send greyscale frames.
+        metadata["gray_frames"] = options.gray_frames
+    # everything else that can change which page a sample finds.
+    if index.matcher == "flann":
+        metadata["flann_ratio"] = index.flann_ratio
+    if index.transition_graph is not None:
+        # the graph itself, in case the folder it came from has grown.
+        graph = json.dumps(index.transition_graph, sort_keys=True)
+        metadata.update({"transition_graph": options.transition_graph,
+                         "transition_graph_signature":
+                             hashlib.sha1(graph.encode()).hexdigest(),
+                         "prior_successors": options.prior_successors,
+                         "prior_margin": options.prior_margin})
+    if options.cascade_top_k > 0:
+        metadata.update({"cascade_top_k": options.cascade_top_k,
+                         "cascade_max_distance": options.cascade_max_distance})
+    if options.decode_mode == "packets":
+        metadata.update({"burst_factor": options.burst_factor,
+                         "burst_padding": options.burst_padding,
+                         "heartbeat_interval": options.heartbeat_interval,
+                         "keyframe_change": options.keyframe_change})
+    return metadata
+
+def adaptive_timeline(video_name, index, options, verbose=True):
+    """Samples a video every coarse_interval seconds, then, wherever two
+    neighbouring samples show different pages, keeps sampling halfway between
+    them until they're less than target_resolution seconds apart.
+    Returns the [[page, confidence], seconds] samples, in order."""
+    video = open_video(video_name, index.metrics)
+    fps = video.get(cv2.CAP_PROP_FPS)
+    total_frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    if fps <= 0 or total_frame_count <= 0:
+        video.release()
+        return []
+    video_length = total_frame_count/fps*1000 # in milliseconds
+
+    # the app stays in the same place, so we only look for it once (unless
+    # the first frame's blank, and then we keep looking).
+    ret, first_frame = video.read()
+    viewport = frame_viewport(first_frame, index, options) if ret else None
+
+    samples = {} # requested time -> [[page, confidence], actual seconds]
+    def sample_at(requested_time):
+        if requested_time not in samples:
+            video.set(cv2.CAP_PROP_POS_MSEC, requested_time)
+            ret, frame = video.read()
+            if not ret:
+                samples[requested_time] = None
+                return None
+            current_time = video.get(cv2.CAP_PROP_POS_MSEC)
+            nonlocal viewport
+            if viewport is None and options.auto_viewport:
+                viewport = frame_viewport(frame, index, options)
+            tiny_frame = index.shrink(frame, viewport)
+            page_and_confidence = index.detect_page(tiny_frame)
+            samples[requested_time] = [page_and_confidence, current_time/1000]
+        return samples[requested_time]
+
+    def label(sample):
+        # low confidence detections all count as the same "page".
+        if sample[0][1] > options.feature_cutoff:
+            return sample[0][0]
+        return None
+
+    coarse_interval = options.coarse_interval*1000
+    resolution = options.target_resolution*1000
+    coarse_times = list(np.arange(0, video_length, coarse_interval))
+    # always finish on the last frame, so we know how long the last page lasted.
+    last_frame_time = (total_frame_count - 1)/fps*1000
+    if last_frame_time > coarse_times[-1]:
+        coarse_times.append(last_frame_time)
+    for requested_time in tqdm(coarse_times, unit="frames",
+                               disable=not verbose,
+                               bar_format="{l_bar}{bar}| {remaining} {rate_fmt} "):
+        sample_at(float(requested_time))
+
+    # the gaps between neighbouring samples that still need refining.
+    gaps = [(float(coarse_times[i]), float(coarse_times[i+1]))
+            for i in range(len(coarse_times)-1)]
+    while gaps:
+        start_time, end_time = gaps.pop()
+        start, end = sample_at(start_time), sample_at(end_time)
+        if (start is None or end is None or label(start) == label(end) or
+                end[1] - start[1] <= resolution/1000):
+            continue
+        middle_time = (start_time + end_time)/2
+        middle = sample_at(middle_time)
+        # if there are no frames in between, we can't get any closer.
+        if middle is None or middle[1] in (start[1], end[1]):
+            continue
+        gaps.append((start_time, middle_time))
+        gaps.append((middle_time, end_time))
+    video.release()
+
+    timeline = sorted([sample for sample in samples.values()
+                       if sample is not None], key=lambda x: x[1])
+    # two requested times can land on the same frame, so only keep one.
+    timeline = [sample for i, sample in enumerate(timeline)
+                if i == 0 or sample[1] != timeline[i-1][1]]
+    if verbose:
+        print("Adaptive sampling: analysed {} frames (sampling the whole "
+              "video that finely would take {}).".format(
+                  len(samples), int(video_length/resolution) + 1))
+    return timeline
+
+def stream_samples(video_name, index, options, verbose=True, start_frame=0,
+                   end_frame=None, previous_page=None, frames=None,
+                   decode_stats=None):
+    """Works out which page is on screen in each sampled frame of a video (or
+    of the frames from start_frame to end_frame, which always reads
+    sequentially), one frame at a time.
+
+    previous_page is the last page confidently detected before start_frame
+    (for the transition graph). frames can be given instead of a video (e.g.
+    from live_frames), as (frame, time in milliseconds, frame position).
+    This is a generator, which yields ([page, confidence], seconds) samples
+    along with the position of the frame after the sample, so that reading
+    can start again from there.
+    """
+    if options.cascade_top_k > 0 and index.page_index is not None:
+        # one flann query already covers every page, so there's nothing to skip.
+        raise ValueError("The cascade (cascade_top_k) only works with the "
+                         "brute force matcher.")
+    analysed_count = 0
+    # Template Matching interval
+    sampling_interval = 1000/options.sample_rate # 500 milliseconds, half a second.
+
+    if decode_stats is None:
+        decode_stats = {"decode_seconds": 0.0, "frames_decoded": 0,
+                        "frames_covered": 0}
+    if frames is not None:
+        # the frames have already been sampled (e.g. from a live stream).
+        video = None
+        total_frame_count = None
+        decode_mode = "live"
+    else:
+        video = open_video(video_name, index.metrics)
+
+        # used to make a pretty loading bar.
+        total_frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    current_frame = start_frame
+
+    loading_bar = tqdm(total=total_frame_count, initial=start_frame,
+                       leave=True, unit="frames", disable=not verbose,
+                       bar_format="{l_bar}{bar}| {remaining} {rate_fmt} ")
+
+    if video is not None:
+        if start_frame > 0 or end_frame is not None:
+            decode_mode = "sequential"
+            frames = sequential_frames(video, sampling_interval, decode_stats,
+                                       start_frame, end_frame)
+        elif options.decode_mode == "packets":
+            decode_mode = "packets"
+            windows = transition_windows(read_packets(video_name),
+                                         sampling_interval,
+                                         options.burst_factor,
+                                         options.burst_padding,
+                                         options.heartbeat_interval,
+                                         keyframe_change=options.keyframe_change)
+            frames = packet_frames(video, windows, decode_stats)
+        elif options.decode_mode == "ffmpeg":
+            decode_mode = "ffmpeg"
+            frames = ffmpeg_frames(video_name, video, options.sample_rate,
+                                   index.resize_factor, decode_stats,
+                                   options.gray_frames)
+        else:
+            decode_mode = options.decode_mode
+            frames = frame_sources[decode_mode](video, sampling_interval,
+                                                decode_stats)
+    # the last frame that we fully analysed, for spotting unchanged screens.
+    last_thumbnail = None
+    skipped_frames = 0
+    # previous_page is the last page that we confidently detected, for
+    # guessing the next one.
+    transition_graph = index.transition_graph
+    prior_stats = {"pruned": 0, "searched": 0, "agreed": 0}
+    screen_signatures = (index.screen_signatures
+                         if options.cascade_top_k > 0 else None)
+    cascade_stats = {"agreed": 0, "cascade_seconds": 0.0, "full_seconds": 0.0}
+    viewport = None
+    frame_cache = None
+    if options.frame_cache:
+        frame_cache = FrameCache(options.frame_cache, index.signature(),
+                                 options.frame_cache_size)
+    for frame, current_time, new_frame in frames:
+        if analysed_count == 0 or (viewport is None and options.auto_viewport):
+            # the app stays in the same place, so we only look once (or, if
+            # the first frames are blank, until we find it).
+            viewport = frame_viewport(frame, index, options)
+        # ffmpeg has already shrunk its frames.
+        tiny_frame = index.shrink(frame, viewport, decode_mode != "ffmpeg")
+        if options.change_threshold > 0:
+            thumbnail = frame_thumbnail(tiny_frame)
+        if (options.change_threshold > 0 and
+                not frame_has_changed(thumbnail, last_thumbnail,
+                                      options.change_threshold)):
+            # it's the same screen as before, so it's the same page.
+            skipped_frames += 1
+        else:
+            cached = None
+            if frame_cache is not None:
+                fingerprint = frame_fingerprint(tiny_frame)
+                cached = frame_cache.lookup(fingerprint)
+            if cached is not None:
+                # we've seen this screen before (maybe in another video).
+                page_and_confidence = cached
+            else:
+                pruned = prior_stats["pruned"]
+                candidates = None
+                if transition_graph is not None:
+                    candidates = likely_pages(previous_page, transition_graph,
+                                              options.prior_successors)
+                    prior_stats["searched"] += 1
+                start = time.perf_counter()
+                shortlist = None
+                if screen_signatures is not None:
+                    shortlist = shortlist_pages(tiny_frame, screen_signatures,
+                                                options.cascade_top_k,
+                                                options.cascade_max_distance)
+                    if candidates is not None:
+                        candidates = [page for page in candidates
+                                      if page in shortlist]
+                page_and_confidence = index.detect_page(tiny_frame, candidates,
+                                                        options.prior_margin,
+                                                        prior_stats, shortlist)
+                # only remember the answers of full searches.
+                full_page = None
+                if shortlist is None and prior_stats["pruned"] == pruned:
+                    full_page = page_and_confidence
+                if screen_signatures is not None and options.cascade_validate:
+                    # how would the full search have done on the same frame?
+                    cascade_stats["cascade_seconds"] += time.perf_counter() - start
+                    start = time.perf_counter()
+                    full_page = index.detect_page(tiny_frame)
+                    cascade_stats["full_seconds"] += time.perf_counter() - start
+                    cascade_stats["agreed"] += full_page[0] == page_and_confidence[0]
+                if (options.prior_validate and prior_stats["pruned"] > pruned):
+                    # would matching every page have found the same one?
+                    if full_page is None:
+                        full_page = index.detect_page(tiny_frame)
+                    prior_stats["agreed"] += full_page[0] == page_and_confidence[0]
+                if frame_cache is not None and full_page is not None:
+                    frame_cache.store(fingerprint, full_page)
+            if page_and_confidence[1] > options.feature_cutoff:
+                previous_page = page_and_confidence[0]
+            if options.change_threshold > 0:
+                last_thumbnail = thumbnail
+
+        # clamp the loading bar between 0 and 1
+        bar_chunk = max(new_frame-current_frame,0)
+        loading_bar.update(bar_chunk)
+        analysed_count += 1
+        current_frame = new_frame
+        yield [page_and_confidence, (current_time)/1000], new_frame
+
+    loading_bar.update(max(decode_stats["frames_covered"]-current_frame,0))
+    loading_bar.close()
+    if frame_cache is not None:
+        frame_cache.close()
+        decode_stats["cache_lookups"] = frame_cache.lookups
+        decode_stats["cache_hits"] = frame_cache.hits
+    if video is not None:
+        video.release()
+    if index.metrics is not None:
+        index.metrics.count("video_frames", decode_stats["frames_covered"] - start_frame)
+        index.metrics.count("frames_decoded", decode_stats["frames_decoded"])
+        index.metrics.count("frames_analysed", analysed_count)
+        index.metrics.count("frames_unchanged", skipped_frames)
+        index.metrics.count("frames_matched_likely_pages", prior_stats["pruned"])
+        if "frames_read" in decode_stats:
+            index.metrics.count("frames_read", decode_stats["frames_read"])
+        if frame_cache is not None:
+            index.metrics.count("frame_cache_lookups", frame_cache.lookups)
+            index.metrics.count("frame_cache_hits", frame_cache.hits)
+
+    if verbose:
+        decode_seconds = max(decode_stats["decode_seconds"], 1e-9)
+        print("Decoding ({} mode): {} frames analysed, {:.1f} video "
+              "frames/sec, {:.1f} analysed frames/sec".format(
+                  decode_mode, decode_stats["frames_decoded"],
+                  (decode_stats["frames_covered"]-start_frame)/decode_seconds,
+                  decode_stats["frames_decoded"]/decode_seconds))
+        if "frames_read" in decode_stats:
+            video_frames = max(decode_stats["frames_covered"] - start_frame, 1)
+            print("Packet pre-pass: decoded {} of {} frames, in {} windows "
+                  "({:.1f}% of the video skipped).".format(
+                      decode_stats["frames_read"], video_frames,
+                      decode_stats["windows"],
+                      100*(1 - decode_stats["frames_read"]/video_frames)))
+        if frame_cache is not None:
+            print("Frame cache: recognised {} of {} frames ({:.1f}% hit "
+                  "rate).".format(frame_cache.hits, frame_cache.lookups,
+                                  100*frame_cache.hits/max(frame_cache.lookups, 1)))
+        if options.change_threshold > 0:
+            print("Skipped {} of {} frames that hadn't changed.".format(
+                skipped_frames, analysed_count))
+        if transition_graph is not None and prior_stats["searched"] > 0:
+            print("Matched {} of {} frames against only the likely pages."
+                  .format(prior_stats["pruned"], prior_stats["searched"]))
+            if options.prior_validate and prior_stats["pruned"] > 0:
+                print("Transition prior: agreed with the full search on "
+                      "{:.1f}% of those frames.".format(
+                          100*prior_stats["agreed"]/prior_stats["pruned"]))
+        # the frames that were actually detected (not unchanged, or cached).
+        detected_frames = analysed_count - skipped_frames
+        if frame_cache is not None:
+            detected_frames -= frame_cache.hits
+        if (screen_signatures is not None and options.cascade_validate and
+                detected_frames > 0):
+            print("Cascade: agreed with the full search on {:.1f}% of frames, "
+                  "{:.2f}x faster.".format(
+                      100*cascade_stats["agreed"]/detected_frames,
+                      cascade_stats["full_seconds"] /
+                      max(cascade_stats["cascade_seconds"], 1e-9)))
+
+def add_decode_stats(metadata, decode_stats, start_frame=0):
+    """Adds how much of the video the packet pre-pass skipped, and how often
+    the frame cache was used, to a timeline's metadata."""
+    if "frames_read" in decode_stats:
+        video_frames = max(decode_stats["frames_covered"] - start_frame, 1)
+        metadata["frames_read"] = decode_stats["frames_read"]
+        metadata["video_skipped"] = round(
+            1 - decode_stats["frames_read"]/video_frames, 4)
+    if "cache_lookups" in decode_stats:
+        metadata["frame_cache_hits"] = decode_stats["cache_hits"]
+        metadata["frame_cache_lookups"] = decode_stats["cache_lookups"]
+
+def analyse_video(video_name, index, options=None, verbose=None,
+                  start_frame=0, end_frame=None):
+    """Works out which page is on screen throughout one video (or the frames
+    from start_frame to end_frame, which always reads sequentially).
+
+    index is a ScreenIndex, and options come from default_options (or the
+    command line). Returns a Timeline.
+    """
+    if options is None:
+        options = default_options()
+    if verbose is None:
+        verbose = options.verbose
+    metadata = run_metadata(index, options)
+    index.metrics = Metrics() if options.metrics else None
+    profiler = cProfile.Profile() if options.cprofile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if options.adaptive and start_frame == 0 and end_frame is None:
+            timeline = adaptive_timeline(video_name, index, options, verbose)
+        else:
+            # This will store which of the pages was seen, and when.
+            decode_stats = {"decode_seconds": 0.0, "frames_decoded": 0,
+                            "frames_covered": 0}
+            timeline = [sample for sample, _ in
+                        stream_samples(video_name, index, options, verbose,
+                                       start_frame, end_frame,
+                                       decode_stats=decode_stats)]
+            add_decode_stats(metadata, decode_stats, start_frame)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        metrics, index.metrics = index.metrics, None
+    return Timeline(video_name, timeline, metadata, metrics, profiler)
+
+def load_checkpoint(checkpoint_path, metadata):
+    """The checkpoint of an unfinished analysis, or None if there isn't one
+    (or it was made with different settings)."""
+    try:
+        with open(checkpoint_path, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("metadata") != metadata:
+        return None
+    return checkpoint
+
+def write_checkpoint(checkpoint_path, checkpoint):
+    # written to a temporary file first, so a crash never leaves half a
+    # checkpoint behind.
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=4)
+    os.replace(temp_path, checkpoint_path)
+
+def stream_video(video_name, index, options, output_folder_path, verbose=None):
+    """Analyses one video, writing each row of its csv file as soon as it's
+    known (instead of keeping the whole timeline in memory until the end).
+
+    Every options.checkpoint_interval seconds of video, the progress so far
+    is saved to timings-<video>.checkpoint.json. With options.resume, an
+    unfinished analysis carries on from its checkpoint instead of starting
+    over. Returns the path of the csv file.
+    """
+    if verbose is None:
+        verbose = options.verbose
+    if options.adaptive:
+        # adaptive sampling jumps around the video, so its rows aren't
+        # known until the end.
+        return analyse_video(video_name, index, options,
+                             verbose).save(output_folder_path, options)
+    if options.resume and options.decode_mode != "sequential":
+        # a resumed video is read sequentially from its checkpoint.
+        raise ValueError("resume only works with decode_mode sequential.")
+    metadata = run_metadata(index, options)
+    os.makedirs(output_folder_path, exist_ok=True)
+    filepath = os.path.join(output_folder_path,
+                            Timeline(video_name).csv_title)
+    checkpoint_path = filepath[:-4] + ".checkpoint.json"
+    checkpoint = None
+    if options.resume and os.path.exists(filepath):
+        checkpoint = load_checkpoint(checkpoint_path, metadata)
+
+    if checkpoint is not None:
+        # forget anything written after the checkpoint; it'll be written again.
+        os.truncate(filepath, checkpoint["csv_bytes"])
+        csv_file = open(filepath, "a", newline="")
+        state = {"page": checkpoint["current_page"],
+                 "start": checkpoint["page_start"],
+                 "time": checkpoint["last_timestamp"]}
+        progress = {"position": checkpoint["frame_position"],
+                    "previous_page": checkpoint["previous_page"],
+                    "rows_written": checkpoint["rows_written"]}
+        if verbose:
+            print("Resuming from {:.1f} seconds.".format(state["time"]))
+    else:
+        csv_file = open(filepath, "w", newline="")
+        state = {}
+        progress = {"position": 0, "previous_page": None, "rows_written": 0}
+    writer = csv.writer(csv_file)
+
+    def save_checkpoint():
+        csv_file.flush()
+        write_checkpoint(checkpoint_path, {
+            "metadata": metadata,
+            "last_timestamp": state["time"],
+            "current_page": state["page"],
+            "page_start": state["start"],
+            "previous_page": progress["previous_page"],
+            "frame_position": progress["position"],
+            "rows_written": progress["rows_written"],
+            "csv_bytes": os.fstat(csv_file.fileno()).st_size})
+
+    def checkpointed(samples):
+        last_checkpoint = state.get("time", 0)
+        for sample, position in samples:
+            yield sample
+            # by now, the sample has been cleaned, and any row it finished
+            # has been written.
+            progress["position"] = position
+            if sample[0][1] > options.feature_cutoff:
+                progress["previous_page"] = sample[0][0]
+            if state["time"] - last_checkpoint >= options.checkpoint_interval:
+                save_checkpoint()
+                last_checkpoint = state["time"]
+
+    index.metrics = Metrics() if options.metrics else None
+    profiler = cProfile.Profile() if options.cprofile else None
+    try:
+        if checkpoint is None and options.header == True:
+            # write a header.
+            writer.writerow(csv_header)
+        decode_stats = {"decode_seconds": 0.0, "frames_decoded": 0,
+                        "frames_covered": 0}
+        start_position = progress["position"]
+        samples = stream_samples(video_name, index, options, verbose,
+                                 progress["position"],
+                                 previous_page=progress["previous_page"],
+                                 decode_stats=decode_stats)
+        if profiler is not None:
+            profiler.enable()
+        for row in clean_rows(checkpointed(samples), options.feature_cutoff,
+                              state):
+            writer.writerow(row)
+            csv_file.flush()
+            progress["rows_written"] += 1
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        metrics, index.metrics = index.metrics, None
+        csv_file.close()
+
+    if progress["rows_written"] == 0:
+        os.remove(filepath)
+        raise ValueError("Couldn't read any frames from " + video_name)
+    # the analysis is finished, so there's nothing left to resume.
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    metadata["feature_cutoff"] = options.feature_cutoff
+    add_decode_stats(metadata, decode_stats, start_position)
+    with open(filepath[:-4] + ".json", "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=4)
+    if metrics is not None:
+        metrics.save(filepath[:-4], file_title(video_name))
+    if profiler is not None:
+        if verbose:
+            print_profile(profiler, filepath[:-4] + ".prof")
+        else:
+            profiler.dump_stats(filepath[:-4] + ".prof")
+    return filepath
+
+
+################### LIVE SESSIONS ###################
+
+def parse_size(size):
+    """"1280x720" -> (1280, 720)"""
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+def put_latest(frame_queue, item, stats):
+    """Adds an item to the queue. If the queue is full (because the
+    classifier has fallen behind), the oldest frame is dropped to make room."""
+    while True:
+        try:
+            frame_queue.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                frame_queue.get_nowait()
+                stats["dropped"] += 1
+            except queue.Empty:
+                pass
+
+def read_raw_frames(stream, width, height, fps, sampling_interval,
+                    frame_queue, stats, stop):
+    """Reads raw bgr24 frames from a stream (until it ends, or stop is set),
+    and queues the ones that land on (or just after) a sampling point, with
+    the time each one arrived. Runs in its own thread."""
+    frame_size = width*height*3
+    position = 0
+    next_sample = 0
+    while not stop.is_set():
+        buffer = stream.read(frame_size)
+        if buffer is None or len(buffer) < frame_size: # the stream has ended.
+            break
+        arrival = time.perf_counter()
+        current_time = position/fps*1000
+        position += 1
+        stats["frames_covered"] = position
+        if current_time >= next_sample:
+            frame = np.frombuffer(buffer, np.uint8).reshape(height, width, 3)
+            put_latest(frame_queue, (frame, current_time, position, arrival),
+                       stats)
+            # the next sampling point after this frame.
+            next_sample = (current_time // sampling_interval + 1) * sampling_interval
+    put_latest(frame_queue, None, stats)
+
+def live_frames(stream, width, height, fps, sampling_interval, stats,
+                queue_size=4):
+    """Yields (frame, time in milliseconds, frame position) for the sampled
+    frames of a live stream, as they arrive.
+
+    The frames are read by another thread into a queue of queue_size frames,
+    so if classifying falls behind, the oldest frames are dropped (and
+    counted in stats["dropped"]) instead of the delay growing forever.
+    stats["arrival"] is when the frame that was just yielded arrived.
+    """
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_raw_frames, daemon=True,
+                              args=(stream, width, height, fps,
+                                    sampling_interval, frame_queue, stats,
+                                    stop))
+    reader.start()
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                break
+            frame, current_time, position, stats["arrival"] = item
+            stats["dequeued"] = time.perf_counter()
+            stats["frames_decoded"] += 1
+            yield frame, current_time, position
+    finally:
+        stop.set()
+
+def video_size(path):
+    """The (width, height) of a video, from ffprobe."""
+    output = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
+                             "-show_entries", "stream=width,height",
+                             "-of", "csv=p=0:s=x", path],
+                            capture_output=True, text=True, check=True).stdout
+    return parse_size(output.strip().split("\n")[0])
+
+def open_live_source(source, live_size="", fps=30, timeout=10):
+    """Opens a live source of raw bgr24 frames.
+
+    source is "-" for frames piped into stdin (live_size must say how big
+    they are), or a recording that's still being written, which ffmpeg
+    follows (and converts to raw frames at fps frames per second) until it
+    stops growing for timeout seconds. The recording needs to be in a format
+    that can be read while it's written (e.g. .ts or .mkv, not .mp4).
+    Returns (stream, width, height, ffmpeg process or None).
+    """
+    if source == "-":
+        if not live_size:
+            raise ValueError("Piped frames need a --live_size, e.g. 1280x720.")
+        width, height = parse_size(live_size)
+        return sys.stdin.buffer, width, height, None
+    if shutil.which("ffmpeg") is None:
+        raise ValueError("Following a recording needs ffmpeg to be installed.")
+    if live_size:
+        width, height = parse_size(live_size)
+    elif shutil.which("ffprobe") is None:
+        raise ValueError("Following a recording needs ffprobe to be installed "
+                         "(or a --live_size, e.g. 1280x720).")
+    else:
+        try:
+            width, height = video_size(source)
+        except subprocess.CalledProcessError as error:
+            raise ValueError("Couldn't read the size of " + source + ": " +
+                             error.stderr.strip())
+    command = ["ffmpeg", "-loglevel", "error",
+               "-follow", "1", "-rw_timeout", str(int(timeout*1000000)),
+               "-i", source,
+               "-vf", "fps={},scale={}:{}".format(fps, width, height),
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    return process.stdout, width, height, process
+
+def latency_summary(latencies):
+    """The 50th, 95th and 99th percentile (and worst) latencies, in seconds."""
+    if len(latencies) == 0:
+        return {}
+    percentiles = np.percentile(latencies, [50, 95, 99])
+    return {"p50": float(percentiles[0]), "p95": float(percentiles[1]),
+            "p99": float(percentiles[2]), "max": float(np.max(latencies))}
+
+def analyse_live(source, index, options, output_folder_path, name="live"):
+    """Classifies a live session (see open_live_source) as it happens.
+
+    Each page change is printed as soon as it's detected, and written to
+    timings-<name>.csv. How long every frame took, from arriving to being
+    classified, is written to latency-<name>.csv, and summarised (along with
+    how many frames were dropped) in timings-<name>.json.
+    Returns the path of the csv file.
+    """
+    stream, width, height, process = open_live_source(
+        source, options.live_size, options.live_fps, options.live_timeout)
+    filepath = os.path.join(output_folder_path, "timings-" + name + ".csv")
+    latency_path = os.path.join(output_folder_path, "latency-" + name + ".csv")
+    stats = {"decode_seconds": 0.0, "frames_decoded": 0, "frames_covered": 0,
+             "dropped": 0}
+    latencies = []
+    state = {}
+    index.metrics = Metrics() if options.metrics else None
+
+    with open(filepath, "w", newline="") as csv_file, \
+         open(latency_path, "w", newline="") as latency_file:
+        writer = csv.writer(csv_file)
+        latency_writer = csv.writer(latency_file)
+        if options.header == True:
+            writer.writerow(csv_header)
+            latency_writer.writerow(["Frame", "Stream_Time_(Seconds)",
+                                     "Queued_(Seconds)", "Latency_(Seconds)"])
+
+        def timed(samples):
+            for sample, position in samples:
+                # from the frame arriving, to knowing which page it shows.
+                latency = time.perf_counter() - stats["arrival"]
+                latencies.append(latency)
+                latency_writer.writerow([position, sample[1],
+                                         stats["dequeued"] - stats["arrival"],
+                                         latency])
+                yield sample
+            stats["ended"] = True
+
+        frames = live_frames(stream, width, height, options.live_fps,
+                             1000/options.sample_rate, stats,
+                             options.live_queue)
+        samples = stream_samples(name, index, options, False, frames=frames,
+                                 decode_stats=stats)
+        try:
+            for row in clean_rows(timed(samples), options.feature_cutoff,
+                                  state):
+                writer.writerow(row)
+                csv_file.flush()
+                if not stats.get("ended"): # the last page doesn't change.
+                    print("{:8.2f}s  {} -> {}".format(row[2], row[0],
+                                                       state["page"][:-4]),
+                          flush=True)
+        except KeyboardInterrupt: # stopping a live session is expected.
+            if state.get("page") is not None:
+                writer.writerow([state["page"][:-4],
+                                 state["time"] - state["start"], state["time"]])
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+            metrics, index.metrics = index.metrics, None
+
+    summary = latency_summary(latencies)
+    metadata = run_metadata(index, options)
+    metadata.update({"decode_mode": "live", "live_fps": options.live_fps,
+                     "frames_received": stats["frames_covered"],
+                     "frames_classified": len(latencies),
+                     "frames_dropped": stats["dropped"],
+                     "latency_seconds": summary})
+    with open(filepath[:-4] + ".json", "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=4)
+    if metrics is not None:
+        metrics.count("frames_dropped", stats["dropped"])
+        metrics.save(filepath[:-4], name)
+    if options.verbose and summary:
+        print("Classified {} frames ({} dropped). Latency: p50 {:.0f} ms, "
+              "p95 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms.".format(
+                  len(latencies), stats["dropped"], 1000*summary["p50"],
+                  1000*summary["p95"], 1000*summary["p99"],
+                  1000*summary["max"]))
+    return filepath
+
+
+############ ANALYSING VIDEOS IN PARALLEL ############
+
+# Everything a worker process needs, set up once per process.
+batch_state = {}
+
+def init_batch_worker(shared_index, options, output_folder_path):
+    batch_state["index"] = ScreenIndex.from_shared(shared_index)
+    batch_state["options"] = options
+    batch_state["output_folder_path"] = output_folder_path
+
+def batch_worker(video_name):
+    """Analyses (and saves) one video of a batch. Errors are returned, not
+    raised, so one corrupt file doesn't abort the whole batch."""
+    try:
+        filepath = stream_video(video_name, batch_state["index"],
+                                batch_state["options"],
+                                batch_state["output_folder_path"],
+                                verbose=False)
+        return video_name, filepath, None
+    except Exception:
+        return video_name, None, traceback.format_exc()
+
+def segment_worker(video_name, start_frame, end_frame):
+    """Analyses one time range of a video, for analyse_video_in_segments.
+    Returns its samples, its Metrics (or None), its metadata and the path of
+    a temporary file holding its profile (or None)."""
+    timeline = analyse_video(video_name, batch_state["index"],
+                             batch_state["options"], False,
+                             start_frame, end_frame)
+    profile_path = None
+    if timeline.profile is not None:
+        # a profile can't be sent back to the main process, but its stats
+        # can be saved and merged there.
+        handle, profile_path = tempfile.mkstemp(suffix=".prof")
+        os.close(handle)
+        timeline.profile.dump_stats(profile_path)
+    return timeline.samples, timeline.metrics, timeline.metadata, profile_path
+
+def segment_boundaries(total_frame_count, segments):
+    """Splits the frames of a video into (start, end) ranges of similar size."""
+    boundaries = np.linspace(0, total_frame_count, segments + 1).astype(int)
+    return [(int(boundaries[i]), int(boundaries[i+1]))
+            for i in range(segments) if boundaries[i+1] > boundaries[i]]
+
+def start_worker_pool(index, options, workers, output_folder_path=None):
+    """Starts a pool of worker processes that share the screenshot features.
+    Returns the pool, and the folder holding the shared features (which
+    should be deleted once the pool is shut down)."""
+    shared_folder = tempfile.mkdtemp(prefix="screen_descriptors_")
+    shared_index = index.share(shared_folder)
+    pool = ProcessPoolExecutor(max_workers=workers,
+                               initializer=init_batch_worker,
+                               initargs=(shared_index, options,
+                                         output_folder_path))
+    return pool, shared_folder
+
+def analyse_video_in_segments(video_name, index, options, pool):
+    """Splits one video into time ranges that are analysed at the same time
+    by the workers in the pool (from start_worker_pool), then joins their
+    timelines back together. The timeline is the same as analysing the video
+    in one go (sequentially). Returns a Timeline."""
+    if options.verbose:
+        print("Analysing " + file_title(video_name) + " in " +
+              str(options.segments) + " segments...")
+    video = cv2.VideoCapture(video_name)
+    total_frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+
+    futures = [pool.submit(segment_worker, video_name, start_frame, end_frame)
+               for start_frame, end_frame in
+               segment_boundaries(total_frame_count, options.segments)]
+    timeline = []
+    metrics = Metrics() if options.metrics else None
+    profile = None # every segment's profile, added together.
+    cache_stats = {"frame_cache_hits": 0, "frame_cache_lookups": 0}
+    for future in tqdm(futures, unit="segments", disable=not options.verbose,
+                       bar_format="{l_bar}{bar}| {remaining} {rate_fmt} "):
+        samples, segment_metrics, segment_metadata, profile_path = \
+            future.result()
+        if metrics is not None:
+            metrics.merge(segment_metrics)
+        if profile_path is not None:
+            if profile is None:
+                profile = pstats.Stats(profile_path)
+            else:
+                profile.add(profile_path)
+            os.remove(profile_path)
+        for name in cache_stats:
+            cache_stats[name] += segment_metadata.get(name, 0)
+        for sample in samples:
+            # the segments are in order, so anything at (or before) the end
+            # of the previous segment has already been seen.
+            if len(timeline) == 0 or sample[1] > timeline[-1][1]:
+                timeline.append(sample)
+    metadata = run_metadata(index, options)
+    # segments are always read sequentially.
+    metadata["decode_mode"] = "sequential"
+    for name in ("gray_frames", "burst_factor", "burst_padding",
+                 "heartbeat_interval", "keyframe_change"):
+        metadata.pop(name, None)
+    if options.frame_cache:
+        metadata.update(cache_stats)
+        if options.verbose:
+            print("Frame cache: recognised {} of {} frames ({:.1f}% hit "
+                  "rate).".format(cache_stats["frame_cache_hits"],
+                                  cache_stats["frame_cache_lookups"],
+                                  100*cache_stats["frame_cache_hits"] /
+                                  max(cache_stats["frame_cache_lookups"], 1)))
+    return Timeline(video_name, timeline, metadata, metrics, profile)
+
+def analyse_videos_in_parallel(video_names, index, options, output_folder_path):
+    """Spreads the videos across options.workers worker processes, and saves
+    each one's csv file. Returns a list of (video name, error message) for any
+    videos that failed."""
+    errors = []
+    pool, shared_folder = start_worker_pool(index, options, options.workers,
+                                            output_folder_path)
+    try:
+        with pool:
+            futures = [pool.submit(batch_worker, video_name)
+                       for video_name in video_names]
+            loading_bar = tqdm(as_completed(futures), total=len(futures),
+                               unit="videos", disable=not options.verbose,
+                               bar_format="{l_bar}{bar}| {remaining} {rate_fmt} ")
+            for future in loading_bar:
+                video_name, filepath, error = future.result()
+                if error is not None:
+                    errors.append((video_name, error))
+                    loading_bar.write("Failed: " + video_name)
+                elif options.verbose:
+                    loading_bar.write(file_title(filepath) + " written.")
+    finally:
+        shutil.rmtree(shared_folder, ignore_errors=True)
+    return errors
+
+
+############ STUDIES (MANY SESSIONS) ############
+
+def read_timeline_rows(filename):
+    """Reads the [page, time taken, cumulative time] rows of a csv file made
+    by videoToMetricsConverter.py (with or without a header)."""
+    rows = []
+    with open(filename, "r", newline="") as csv_file:
+        for row in csv.reader(csv_file):
+            if len(row) < 3:
+                continue
+            try:
+                rows.append([row[0], float(row[1]), float(row[2])])
+            except ValueError: # a header
+                continue
+    return rows
+
+class SessionStore:
+    """Every session's timeline in one place, as columns of numbers, so
+    questions about a whole study don't have to re-read every csv file.
+
+    Each column (which session, which page, when the visit started, and how
+    long it lasted) is an append-only binary file, with one entry per row of
+    the csv files. Pages are stored as numbers; manifest.json holds the page
+    names, and which csv file (at which size and modification time) each
+    session came from, so only new or changed files are read again.
+    """
+    # dtype names (not np.int32 etc.), so importing this file doesn't load numpy.
+    columns = {"session": "int32", "page": "int32", "start": "float64",
+               "dwell": "float64"}
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, "manifest.json")
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as manifest_file:
+                self.manifest = json.load(manifest_file)
+        else:
+            self.manifest = {"version": 1, "rows": 0, "pages": [],
+                             "sessions": []}
+        self.page_codes = {page: code for code, page in
+                           enumerate(self.manifest["pages"])}
+
+    def column_path(self, name):
+        return os.path.join(self.folder, name + ".bin")
+
+    def save_manifest(self):
+        # written last, and all at once, so a crash half way through an
+        # ingest just forgets the rows that were being added.
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    def page_code(self, page):
+        if page not in self.page_codes:
+            self.page_codes[page] = len(self.manifest["pages"])
+            self.manifest["pages"].append(page)
+        return self.page_codes[page]
+
+    def ingest(self, csv_names):
+        """Adds any new (or changed) csv files to the store.
+        Returns how many sessions were (added, updated, unchanged)."""
+        os.makedirs(self.folder, exist_ok=True)
+        # the newest version of each file that we've already got.
+        known = {session["file"]: session for session in self.manifest["sessions"]
+                 if not session["deleted"]}
+        added = updated = unchanged = 0
+        new_columns = {name: [] for name in self.columns}
+        rows = self.manifest["rows"]
+        for filename in csv_names:
+            key = os.path.abspath(filename)
+            status = os.stat(filename)
+            session = known.get(key)
+            if (session is not None and session["mtime"] == status.st_mtime and
+                    session["size"] == status.st_size):
+                unchanged += 1
+                continue
+            if session is not None:
+                # the old version stays in the columns, but is ignored.
+                session["deleted"] = True
+                updated += 1
+            else:
+                added += 1
+            timeline_rows = read_timeline_rows(filename)
+            session_id = len(self.manifest["sessions"])
+            self.manifest["sessions"].append({
+                "name": os.path.basename(filename)[:-4], "file": key,
+                "mtime": status.st_mtime, "size": status.st_size,
+                "first_row": rows, "rows": len(timeline_rows),
+                "deleted": False})
+            rows += len(timeline_rows)
+            for page, dwell, cumulative in timeline_rows:
+                new_columns["session"].append(session_id)
+                new_columns["page"].append(self.page_code(page))
+                new_columns["start"].append(cumulative - dwell)
+                new_columns["dwell"].append(dwell)
+
+        self.truncate_columns()
+        for name, dtype in self.columns.items():
+            with open(self.column_path(name), "ab") as column_file:
+                np.array(new_columns[name], dtype).tofile(column_file)
+        self.manifest["rows"] = rows
+        self.save_manifest()
+        return added, updated, unchanged
+
+    def truncate_columns(self):
+        # forget anything appended after the manifest was last saved.
+        for name, dtype in self.columns.items():
+            path = self.column_path(name)
+            expected = self.manifest["rows"]*np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > expected:
+                os.truncate(path, expected)
+
+    def load(self, include_deleted=False):
+        """The columns, as {name: array} (memory-mapped, so only the parts
+        that are used are read from disk), without old versions of files."""
+        data = {}
+        for name, dtype in self.columns.items():
+            path = self.column_path(name)
+            if self.manifest["rows"] == 0 or not os.path.exists(path):
+                data[name] = np.zeros(0, dtype)
+            else:
+                data[name] = np.memmap(path, dtype, mode="r",
+                                       shape=(self.manifest["rows"],))
+        if not include_deleted:
+            deleted = np.array([session["deleted"] for session in
+                                self.manifest["sessions"]], bool)
+            if deleted.any():
+                keep = ~deleted[data["session"]]
+                data = {name: column[keep] for name, column in data.items()}
+        return data
+
+    def compact(self):
+        """Rewrites the columns without the old versions of changed files."""
+        data = self.load()
+        sessions = self.manifest["sessions"]
+        live = [i for i, session in enumerate(sessions) if not session["deleted"]]
+        new_ids = np.full(len(sessions), -1, np.int32)
+        new_ids[live] = np.arange(len(live), dtype=np.int32)
+        data["session"] = new_ids[data["session"]]
+        for name, dtype in self.columns.items():
+            temp_path = self.column_path(name) + ".tmp"
+            np.asarray(data[name], dtype).tofile(temp_path)
+            os.replace(temp_path, self.column_path(name))
+        first_row = 0
+        self.manifest["sessions"] = [sessions[i] for i in live]
+        for session in self.manifest["sessions"]:
+            session["first_row"] = first_row
+            first_row += session["rows"]
+        self.manifest["rows"] = first_row
+        self.save_manifest()
+
+    @property
+    def pages(self):
+        return list(self.manifest["pages"])
+
+    def session_count(self):
+        return sum(not session["deleted"] for session in self.manifest["sessions"])
+
+    def dwell_stats(self):
+        """How long each visit to each page lasted, across every session:
+        {page: {visits, sessions, total, mean, median, p90}} (in seconds)."""
+        data = self.load()
+        page_count = len(self.manifest["pages"])
+        visits = np.bincount(data["page"], minlength=page_count)
+        totals = np.bincount(data["page"], weights=data["dwell"],
+                             minlength=page_count)
+        # how many different sessions visited each page.
+        visited = np.unique(data["session"].astype(np.int64)*page_count + data["page"])
+        sessions = np.bincount(visited % page_count, minlength=page_count)
+        # sort the visits by page, then split them up to find the medians.
+        order = np.lexsort((data["dwell"], data["page"]))
+        dwell_by_page = np.split(np.asarray(data["dwell"])[order],
+                                 np.cumsum(visits)[:-1])
+        stats = {}
+        for code, page in enumerate(self.manifest["pages"]):
+            if visits[code] == 0:
+                continue
+            stats[page] = {"visits": int(visits[code]),
+                           "sessions": int(sessions[code]),
+                           "total": float(totals[code]),
+                           "mean": float(totals[code]/visits[code]),
+                           "median": float(np.median(dwell_by_page[code])),
+                           "p90": float(np.percentile(dwell_by_page[code], 90))}
+        return stats
+
+    def transition_matrix(self):
+        """matrix[a, b] is how many times a user went from page a to page b
+        (in the order of self.pages)."""
+        data = self.load()
+        page_count = len(self.manifest["pages"])
+        same_session = data["session"][:-1] == data["session"][1:]
+        from_pages = data["page"][:-1][same_session].astype(np.int64)
+        to_pages = data["page"][1:][same_session].astype(np.int64)
+        return np.bincount(from_pages*page_count + to_pages,
+                           minlength=page_count*page_count
+                           ).reshape(page_count, page_count)
+
+    def funnel(self, steps):
+        """How many sessions visited each of the steps (pages), in order
+        (other pages in between are fine). Returns [(page, sessions), ...]."""
+        data = self.load()
+        session_ids = data["session"]
+        row_numbers = np.arange(len(session_ids))
+        session_count = len(self.manifest["sessions"])
+        # the row where each session reached the previous step (-1 to start).
+        reached = np.full(session_count, -1, np.int64)
+        still_going = np.zeros(session_count, bool)
+        still_going[np.unique(session_ids)] = True
+        results = []
+        for step in steps:
+            if step not in self.page_codes:
+                still_going[:] = False
+            else:
+                candidates = ((data["page"] == self.page_codes[step]) &
+                              (row_numbers > reached[session_ids]) &
+                              still_going[session_ids])
+                first = np.full(session_count, np.iinfo(np.int64).max)
+                np.minimum.at(first, session_ids[candidates],
+                              row_numbers[candidates])
+                still_going &= first != np.iinfo(np.int64).max
+                reached = np.where(still_going, first, reached)
+            results.append((step, int(still_going.sum())))
+        return results
+
+    def common_paths(self, length=3, top=10):
+        """The most common runs of length pages in a row, across every
+        session. Returns [([page, ...], count), ...]."""
+        data = self.load()
+        page_count = max(len(self.manifest["pages"]), 1)
+        rows = len(data["page"])
+        if rows < length:
+            return []
+        session_ids = data["session"]
+        # every run of length pages gets one number, page by page.
+        codes = np.zeros(rows - length + 1, np.int64)
+        same_session = np.ones(rows - length + 1, bool)
+        for offset in range(length):
+            codes = codes*page_count + data["page"][offset:rows - length + 1 + offset]
+            same_session &= (session_ids[offset:rows - length + 1 + offset] ==
+                             session_ids[:rows - length + 1])
+        paths, counts = np.unique(codes[same_session], return_counts=True)
+        results = []
+        for i in np.argsort(counts, kind="stable")[::-1][:top]:
+            code = int(paths[i])
+            pages = []
+            for _ in range(length):
+                pages.append(self.manifest["pages"][code % page_count])
+                code //= page_count
+            results.append((pages[::-1], int(counts[i])))
+        return results
+
+
+##################### PLOTTING #####################
+
+def rectangles(left, bottom, width, height):
+    """The corners of many rectangles at once, as an (n, 4, 2) array."""
+    right, top = left + width, bottom + height
+    return np.stack([np.stack([left, bottom], axis=1),
+                     np.stack([left, top], axis=1),
+                     np.stack([right, top], axis=1),
+                     np.stack([right, bottom], axis=1)], axis=1)
+
+def draw_timeline(ax, page_names, pages, durations, box_colour="blue",
+                  transition_colour="pink", transition_thickness=0.5,
+                  box_height=0.8):
+    """Draws one box per visit to a page (one row per page on the y axis),
+    with a thin bar joining each box to the next one.
+
+    Every box (and every joining bar) is one polygon in a single collection,
+    so drawing takes the same time however many pages there are.
+    """
+    from matplotlib.collections import PolyCollection # to draw lots of boxes at once
+
+    # every x value gets a bar that's invisible EXCEPT for the x value
+    # mentioned in the current line
+    page_numbers = {page: i for i, page in enumerate(page_names)}
+    rows = np.array([page_numbers[page] for page in pages], dtype=float)
+    widths = np.asarray(durations, dtype=float)
+    # each box starts where the previous one finished.
+    lefts = np.concatenate([[0], np.cumsum(widths)[:-1]])
+
+    # draw a line connecting each pair of rectangles
+    low_rows = np.minimum(rows[:-1], rows[1:])
+    high_rows = np.maximum(rows[:-1], rows[1:])
+    transitions = PolyCollection(
+        rectangles(lefts[1:], low_rows, np.full(len(low_rows),
+                                                transition_thickness),
+                   high_rows - low_rows),
+        facecolors=transition_colour, edgecolors="none")
+    boxes = PolyCollection(
+        rectangles(lefts, rows - box_height/2, widths,
+                   np.full(len(rows), box_height)),
+        facecolors=box_colour, edgecolors="none")
+    # the time axis starts at exactly 0, like a bar chart's.
+    boxes.sticky_edges.x.append(0)
+    ax.add_collection(transitions)
+    ax.add_collection(boxes)
+
+    # make room for every page (even the ones that weren't visited), and a
+    # joining bar above the top one.
+    ax.update_datalim([(0, -box_height/2), (0, len(page_names))])
+    ax.autoscale_view()
+    ax.set_yticks(range(len(page_names)))
+    ax.set_yticklabels(page_names)
+
+def read_timings(filename, page_names, header=True):
+    """Reads a csv file made by videoToMetricsConverter.py.
+    Returns its [page, time taken, cumulative time] rows, and the total time.
+    Any pages that aren't in page_names are added to the end of it."""
+    data = []
+    #filename = "timings-WM.csv"
+    with open(filename, "r") as fp:
+        if header == True:
+            line = fp.readline() # Ignore the first line, it's a header
+        line = fp.readline()
+        while line != "":
+            temp_row = line.strip().split(",")
+            # if the user decides to add their own custom pages (which don't
+            # correspond with the app_screenshots folder)
+            if temp_row[0] not in page_names:
+                if temp_row[0] != "low confidence detection":
+                    page_names.append(temp_row[0])
+            data.append([temp_row[0], float(temp_row[1]), float(temp_row[2])])
+            line = fp.readline()
+    total_seconds = float(temp_row[2]) # the last line read
+    return data, total_seconds
+
+def render_plot(filename, page_names, output_folder_path, plot_type=".svg",
+                header=True):
+    """Draws the timeline in one csv file, and saves it in output_folder_path.
+    Returns the path of the saved plot."""
+    from matplotlib.figure import Figure # no pyplot, so finished plots aren't kept in memory
+
+    page_names = list(page_names) # this file's custom pages stay in this plot.
+    data, total_seconds = read_timings(filename, page_names, header)
+
+    fig = Figure()
+    ax = fig.subplots()
+    draw_timeline(ax, page_names, [line[0] for line in data],
+                  [line[1] for line in data])
+
+    ax.set_title("App Usage\n", fontsize=20)
+    total_seconds_cleaned = round(total_seconds/10)*10 + 10
+    ax.set_xticks(range(0, int(total_seconds_cleaned), 10))
+    ax.set_xlabel("Seconds", fontsize=12)
+
+     # make sure it's just the filename here
+    plot_filename = filename[:-4] # takes away the extension name
+    plot_filename = plot_filename.split("/")[-1].split("\\")[-1]
+    if "." not in plot_type:
+        extension = "." + plot_type
+    else:
+        extension = plot_type
+
+    plot_filename += extension
+    os.makedirs(output_folder_path, exist_ok=True)
+    filepath = os.path.join(output_folder_path, plot_filename)
+    if plot_type != ".svg":
+        fig.savefig(filepath, bbox_inches='tight', dpi = 300)
+    else:
+        fig.savefig(filepath, bbox_inches='tight')
+    # let go of everything we drew, straight away.
+    fig.clear()
+    return filepath
+
+def render_worker(filename, page_names, output_folder_path, plot_type, header):
+    """Draws one plot of a batch. Errors are returned, not raised, so one
+    broken file doesn't stop the whole batch."""
+    try:
+        return filename, render_plot(filename, page_names, output_folder_path,
+                                     plot_type, header), None
+    except Exception:
+        return filename, None, traceback.format_exc()
+
+def render_plots_in_parallel(csv_names, page_names, output_folder_path,
+                             plot_type, header, workers):
+    """Spreads the plots across a pool of worker processes.
+    Returns a list of (csv file, error message) for any plots that failed."""
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_worker, filename, page_names,
+                               output_folder_path, plot_type, header)
+                   for filename in csv_names]
+        loading_bar = tqdm(as_completed(futures), total=len(futures),
+                           unit="plots",
+                           bar_format="{l_bar}{bar}| {remaining} {rate_fmt} ")
+        for future in loading_bar:
+            filename, filepath, error = future.result()
+            if error is not None:
+                errors.append((filename, error))
+                loading_bar.write("Failed: " + filename)
+    return errors
@@ -1,10 +1,10 @@
-
-import cv2 # I am running version 4.7.0
 import argparse # This takes in any command-line arguments that the users enters.
 import os # This allows us to check other directories, if we need to.
-from tqdm import tqdm # This makes the pretty loading bars that you see
-import csv # to write the timings to a csv file.
 import gc # just in case there's any memory leaks (opencv can be weird)
+import shutil # to tidy up the folder of shared screenshot features afterwards
+
+import userTestingTool as utt # everything that does the actual work
+from userTestingTool import string_or_list, getFileNames, DEFAULT_OPTIONS
 
 """
 Video to Metrics Converter
@@ -23,6 +23,71 @@ Args:
     feature_cutoff (int): If any frames are poorly detected (fewer features than the cutoff), we'll ignore them. Default = 10.
     additional_image_types (str/list): If your image screenshots are of an unconventional filetype, enter the filetype(s) here. Default = "".
     additional_video_types (str/list): If your video screenshots are of an unconventional filetype, enter the filetype(s) here. Default = "".
+    matcher (str): "brute" compares each frame with every screenshot, one at a time.
+                   "flann" searches one combined index of every screenshot's features. Default = "brute".
+    flann_ratio (float): How much closer the best match must be than the second best, for "flann" votes. Default = 0.8.
+    descriptor_cache (str): Where we save the screenshot features between runs.
+                            Default = "<app_screens_directory>/.screen_features_cache.npz".
+    rebuild_cache (bool): Recalculate the features of every screenshot, replacing the cache. Default = False.
+    no_cache (bool): Don't read or write the screenshot feature cache. Default = False.
+    workers (int): How many videos to analyse at the same time (one per CPU core). Default = 1.
+    segments (int): Split each video into this many time ranges, which are analysed at the same time. Default = 1.
+    roi (str): The part of each frame that shows the app, "x,y,width,height" as fractions. Frames are cropped to it. Default = "".
+    mask_regions (str): Parts of the app to ignore in the screenshots and frames, "x,y,width,height;...". Default = "".
+    auto_viewport (bool): Find the app in each video (trimming plain borders, at the screenshots' aspect ratio),
+                          and crop every frame to it. Default = False.
+    change_threshold (float): If a frame differs from the last analysed frame by less than this
+                              (average pixel difference, 0-255), we reuse its page. 0 turns this off. Default = 0.
+    adaptive (bool): Sample coarsely, and only sample finely around the moments the page changes
+                     (instead of using sample_rate). Default = False.
+    coarse_interval (float): With adaptive, how often (in seconds) we sample at first. Default = 2.
+    target_resolution (float): With adaptive, how precisely (in seconds) we find page changes. Default = 0.1.
+    transition_graph (str): A folder of earlier generated metrics (or a csv of "from page,to page,count" rows).
+                            Frames are matched against the last page and its most likely next pages first. Default = "".
+    prior_successors (int): With transition_graph, how many likely next pages to try first. Default = 3.
+    prior_margin (int): With transition_graph, how many distinctive feature matches (that pass Lowe's ratio test)
+                        the best likely page needs, before we skip matching the rest. Default = 30.
+    prior_validate (bool): With transition_graph, also run the full search whenever we skipped it, and report
+                           how often they agree. Default = False.
+    cascade_top_k (int): Before SIFT matching, compare a tiny thumbnail and colour histogram of each frame
+                         with every screenshot, and only match the closest k pages (only with matcher brute:
+                         flann already matches every page at once). 0 turns this off. Default = 0.
+    cascade_max_distance (float): With cascade_top_k, also drop pages whose thumbnails and colours are
+                                  further away than this. 0 turns this off. Default = 0.
+    cascade_validate (bool): With cascade_top_k, also run the full search, and report how often they agree
+                             and the speedup. Default = False.
+    features (str): Which features describe the frames: "sift" (accurate), or the much quicker
+                    binary "orb" / "akaze" (if your OpenCV has it). Saved in timings-<video>.json. Default = "sift".
+    decode_mode (str): "sequential" reads through the video once, only fully decoding the frames we analyse.
+                       "seek" jumps to every analysed frame (faster for very low sample rates).
+                       "ffmpeg" lets ffmpeg pick out and shrink the frames we analyse, so full size frames
+                       are never copied out of the decoder (needs ffmpeg).
+                       "packets" looks at the size of every (still encoded) frame first, and only decodes
+                       around the likely page changes (and every heartbeat_interval seconds). Default = "sequential".
+    gray_frames (bool): With decode_mode ffmpeg, have ffmpeg send greyscale frames. Default = False.
+    burst_factor (float): With decode_mode packets, how many times bigger than usual a frame must be to count as a
+                          likely page change. Default = 4.
+    burst_padding (float): With decode_mode packets, how many seconds either side of a likely page change we decode. Default = 1.
+    heartbeat_interval (float): With decode_mode packets, how often (in seconds) we check the page anyway. Default = 10.
+    keyframe_change (float): With decode_mode packets, how much bigger or smaller (as a fraction) a keyframe must be
+                             than the one before to count as a likely page change. Default = 0.05.
+    frame_cache (str): A database file where the page on each (shrunk) frame is remembered, so screens that have been
+                       seen before, in any video, aren't detected again. With cascade_top_k (or transition_graph),
+                       new frames are only added with cascade_validate (or prior_validate). Default = "" (no frame cache).
+    frame_cache_size (int): How many frames the frame cache remembers (the least recently seen are forgotten first). Default = 100000.
+    checkpoint_interval (float): How often (in seconds of video) we save our progress while the csv file is written. Default = 30.
+    resume (bool): Carry on from the checkpoint of any unfinished videos, instead of starting them over
+                   (only with decode_mode sequential). Default = False.
+    metrics (bool): Count and time every step, and save timings-<video>.metrics.json and timings-<video>.prom. Default = False.
+    cprofile (bool): Profile each video with cProfile, and save timings-<video>.prof (with segments, the
+                     segments' profiles are added together). Default = False.
+    live (bool): Classify a session while it's recorded, from raw bgr24 frames piped into stdin ("-"),
+                 or a recording that's still being written (which needs ffmpeg, and ffprobe unless there's a
+                 live_size). Default = False.
+    live_size (str): With live, the width and height of the frames, e.g. 1280x720. Default = "".
+    live_fps (float): With live, how many frames arrive per second. Default = 30.
+    live_queue (int): With live, how many sampled frames can wait to be classified before the oldest is dropped. Default = 4.
+    live_timeout (float): With live, how long a growing recording can stop growing before it's finished. Default = 10.
     header (bool): Specifies whether to write an initial row of header data to the output file(s). Default = True.
     verbose (bool): Enable verbose output. Default = True.
 
@@ -30,37 +95,6 @@ Returns:
     None
 """
 
-
-def detect_page(frame, full_descriptors):
-    _, full_frame_desc = orb.detectAndCompute(frame, None)
-    full_frame_scores = []
-    for page in full_descriptors.keys():
-            full_matches = bf_match.match(full_descriptors[page], full_frame_desc)
-            full_frame_scores.append([page, len(full_matches)])
-
-    full_frame_scores = sorted(full_frame_scores, key = lambda x: x[1])[::-1]
-    # clear memory
-    full_frame_desc = None
-    return full_frame_scores[0]
-
-def string_or_list(arg_value):
-    #If it's a single file, or a single directory name, keep it as is.
-    output = arg_value
-    if "," in arg_value:
-        output = arg_value.split(",")
-        # if the first character of the first file has [,
-        if output[0][0] == "[":
-            # get rid of it
-            output[0] = output[0][1:]
-        # if the last character of the last file has ],
-        if output[len(output)-1][-1] == "]":
-            # get rid of it.
-            output[len(output)-1] = output[len(output)-1][:-1]
-    return output
-
-def getFileNames(directory, extensions):
-    return [os.path.join(directory,f) for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)) and os.path.splitext(f)[1].lower() in extensions]
-
 parser = argparse.ArgumentParser(
     description="Video to Metrics Converter\n"
                 "Convert your Usability Test screen recordings into insightful metrics.",
@@ -87,19 +121,19 @@ parser.add_argument(
 parser.add_argument(
     "--sample_rate",
     type=int,
-    default=2,
+    default=DEFAULT_OPTIONS["sample_rate"],
     help="The number of times we analyse the video (per second). Default = 2")
 
 parser.add_argument(
     "--resize_factor",
     type=float,
-    default=0.25,
+    default=DEFAULT_OPTIONS["resize_factor"],
     help="The percentage of the original images that we shrink by, for analysis. Default = 0.25")
 
 parser.add_argument(
     "--feature_cutoff",
     type=int,
-    default=10,
+    default=DEFAULT_OPTIONS["feature_cutoff"],
     help="If any frames are poorly detected (fewer features than the cutoff), we'll ignore them. Default = 10")
 
 parser.add_argument(
@@ -115,237 +149,421 @@ parser.add_argument(
     help='If your video screenshots are of an unconventional filetype, enter the filetype(s) here. Default = ""')
 
 parser.add_argument(
-    "--header",
-    type=bool,
-    default=True,
-    help="Specifies whether to write an initial row of header data to the output file(s). Default = True")
-    
+    "--features",
+    type=str,
+    choices=list(utt.feature_backends.keys()),
+    default=DEFAULT_OPTIONS["features"],
+    help='Which features describe the frames: "sift" (accurate), or the much quicker\n'
+         'binary "orb" / "akaze" (if your OpenCV has it), which are compared with the\n'
+         'Hamming distance. Saved alongside the csv file in timings-<video>.json. Default = "sift"')
+
 parser.add_argument(
-    '-v', '--verbose', 
-    #action='store_true',
-    default=True,
-    help='Enable verbose output.')
-    
-args = parser.parse_args()
-#input(args.app_screens_directory)
-gc.collect() # If you close the code early, 
-             # this makes sure that we've got enough memory to work with.
-
-image_extensions = [".jpg", ".jpeg", ".png",".raw"]
-video_extensions = [".mp4", ".mov", ".avi"]
-
-
-### ADDITIONAL FILETYPES ###
-# if the user specifies multiple unique filetypes
-if type(args.additional_image_types) == list:
-    # for any of the filetypes that the user has added,
-    for image_type in args.additional_image_types:
-        # if the user has just written "jpg", and not ".jpg",
-        if image_type[0] != ".":
-            # add that "." at the beginning of the extention.
-            temp_image_type = "." + image_type.lower()
-        else:
-            temp_image_type = image_type.lower()
-        # if we haven't seen this type before,
-        if temp_image_type not in image_extensions:
-            # add it to the list
-            image_extensions.append(temp_image_type)
-# else, if user has just provided 1 new extension.
-elif len(args.additional_image_types) > 1:
-    # if the user has just written "jpg", and not ".jpg",
-    if args.additional_image_types[0] != ".":
-        # add that "." at the beginning of the extention.
-        temp_image_type = "." + args.additional_image_types.lower()
-    else:
-        temp_image_type = args.additional_image_types.lower()
-    # if we haven't seen this type before,
-    if temp_image_type not in image_extensions:
-        # add it to the list
-        image_extensions.append(temp_image_type)
+    "--matcher",
+    type=str,
+    choices=["brute", "flann"],
+    default=DEFAULT_OPTIONS["matcher"],
+    help='"brute" compares each frame with every screenshot, one at a time (exact).\n'
+         '"flann" searches one combined index of every screenshot\'s features\n'
+         '(much faster when there are lots of screenshots). Default = "brute"')
 
+parser.add_argument(
+    "--flann_ratio",
+    type=float,
+    default=DEFAULT_OPTIONS["flann_ratio"],
+    help="How much closer the best match must be than the second best, for \"flann\" votes. Default = 0.8")
 
+parser.add_argument(
+    "--descriptor_cache",
+    type=str,
+    default="",
+    help="Where we save the screenshot features between runs, so unchanged screenshots aren't recalculated.\n"
+         'Default = "<app_screens_directory>/.screen_features_cache.npz"')
 
-if type(args.additional_video_types) == list:
-    # for any of the filetypes that the user has added,
-    for video_type in args.additional_video_types:
-        # if the user has just written "jpg", and not ".jpg",
-        if video_type[0] != ".":
-            # add that "." at the beginning of the extention.
-            temp_video_type = "." + video_type.lower()
-        else:
-            temp_video_type = video_type.lower()
-        # if we haven't seen this type before,
-        if temp_video_type not in video_extensions:
-            # add it to the list
-            video_extensions.append(temp_video_type)
-            
-# The user has just provided 1 new extension.
-elif len(args.additional_video_types) > 1:
-    # if the user has just written "jpg", and not ".jpg",
-    if args.additional_video_types[0] != ".":
-            # add that "." at the beginning of the extention.
-            temp_video_type = "." + args.additional_video_types.lower()
-    else:
-        temp_video_type = args.additional_video_types.lower()
-    # if we haven't seen this type before,
-    if temp_video_type not in video_extensions:
-        # add it to the list
-        video_extensions.append(temp_video_type)
-            
-############################
-
-
-### IF THE USER SPECIFIES ONE OR MORE VIDEOS ####
-
-if type(args.video_recording) == list:
-    video_names = args.video_recording
-elif type(args.video_recording) == str:
-    if args.video_recording[-4:].lower() in video_extensions:
-        video_names = [args.video_recording]
-    else:
-        video_names = getFileNames(args.video_recording, video_extensions)
-#################################################
+parser.add_argument(
+    "--rebuild_cache",
+    action="store_true",
+    help="Recalculate the features of every screenshot, replacing the cache.")
+
+parser.add_argument(
+    "--no_cache",
+    action="store_true",
+    help="Don't read or write the screenshot feature cache.")
+
+parser.add_argument(
+    "--roi",
+    type=str,
+    default=DEFAULT_OPTIONS["roi"],
+    help='The part of each frame that shows the app, as fractions of its width and height:\n'
+         '"x,y,width,height", e.g. "0,0.05,1,0.9". Frames are cropped to it before we look for\n'
+         'features, so OS chrome and letterboxing are ignored (and matching is quicker). Default = ""')
 
-image_names = getFileNames(args.app_screens_directory, image_extensions)
+parser.add_argument(
+    "--mask_regions",
+    type=str,
+    default=DEFAULT_OPTIONS["mask_regions"],
+    help='Parts of the app to ignore in both the screenshots and the frames (e.g. the status bar,\n'
+         'or notification banners), as fractions of the app\'s width and height:\n'
+         '"x,y,width,height;x,y,width,height", e.g. "0,0,1,0.06". Default = ""')
 
-# The secret sauce. Our template matches uses scale-invariant feature transform
-# to detect frames.
-orb = cv2.SIFT_create()
+parser.add_argument(
+    "--auto_viewport",
+    action="store_true",
+    help="Find the app in the first frame of each video, by trimming plain borders and\n"
+         "cutting it down to the screenshots' aspect ratio, and crop every frame to it.\n"
+         "--roi is used instead, if it's given.")
 
-images = []
-full_descriptors = {}
+parser.add_argument(
+    "--change_threshold",
+    type=float,
+    default=DEFAULT_OPTIONS["change_threshold"],
+    help="If a frame differs from the last analysed frame by less than this\n"
+         "(average pixel difference, 0-255), we reuse its page instead of matching again.\n"
+         "Around 2 works well for screen recordings. 0 turns this off. Default = 0")
 
-bf_match = cv2.BFMatcher(cv2.NORM_L1, crossCheck=True)
+parser.add_argument(
+    "--adaptive",
+    action="store_true",
+    help="Sample coarsely, and only sample finely around the moments the page changes\n"
+         "(instead of using --sample_rate).")
 
+parser.add_argument(
+    "--coarse_interval",
+    type=float,
+    default=DEFAULT_OPTIONS["coarse_interval"],
+    help="With --adaptive, how often (in seconds) we sample at first. Default = 2")
 
+parser.add_argument(
+    "--target_resolution",
+    type=float,
+    default=DEFAULT_OPTIONS["target_resolution"],
+    help="With --adaptive, how precisely (in seconds) we find page changes. Default = 0.1")
 
-if args.verbose:
-    print("Loading in images and calculating features (Please Wait)")
+parser.add_argument(
+    "--transition_graph",
+    type=str,
+    default=DEFAULT_OPTIONS["transition_graph"],
+    help='A folder of earlier generated metrics (or a csv of "from page,to page,count" rows).\n'
+         "Frames are matched against the last page and its most likely next pages first,\n"
+         'and only against every page if none of those match well. Default = ""')
 
-pages = []
+parser.add_argument(
+    "--prior_successors",
+    type=int,
+    default=DEFAULT_OPTIONS["prior_successors"],
+    help="With --transition_graph, how many likely next pages to try first. Default = 3")
 
-for image_path in tqdm(image_names, unit="images", 
-                       bar_format="{l_bar}{bar}| {remaining} {rate_fmt} "):
-    image_file = image_path.split("/")[-1].split("\\")[1]
-    pages.append(image_file[:-4])
-    # 2778, 1284 for iPhone 13 Pro Max
-    temp_image = cv2.imread(image_path)
-    # keypoints, descriptors (we only care about about the descriptors)
-    tiny_image = cv2.resize(temp_image, (0,0), fx=args.resize_factor, 
-                                               fy=args.resize_factor)
-    _, full_descriptors[image_file] = orb.detectAndCompute(tiny_image, None)
+parser.add_argument(
+    "--prior_margin",
+    type=int,
+    default=DEFAULT_OPTIONS["prior_margin"],
+    help="With --transition_graph, how many distinctive feature matches (that pass Lowe's ratio test)\n"
+         "the best likely page needs, before we skip matching the rest. Default = 30")
 
-if args.verbose:
-    print("Loaded images.")
+parser.add_argument(
+    "--prior_validate",
+    action="store_true",
+    help="With --transition_graph, also run the full search whenever we skipped it, and report\n"
+         "how often they agree.")
 
-folder_name = args.output_data_directory.split("/")[-1].split("\\")[-1]
-output_folder_path = os.path.join(os.getcwd(), folder_name)
+parser.add_argument(
+    "--cascade_top_k",
+    type=int,
+    default=DEFAULT_OPTIONS["cascade_top_k"],
+    help="Before SIFT matching, compare a tiny thumbnail and colour histogram of each frame\n"
+         "with every screenshot, and only match the closest k pages (only with --matcher brute:\n"
+         "flann already matches every page at once). 0 turns this off. Default = 0")
 
-if not os.path.exists(output_folder_path):
-    os.makedirs(output_folder_path)
-# Template Matching interval
-sampling_interval = 1000/args.sample_rate # 500 milliseconds, half a second.
+parser.add_argument(
+    "--cascade_max_distance",
+    type=float,
+    default=DEFAULT_OPTIONS["cascade_max_distance"],
+    help="With --cascade_top_k, also drop pages whose thumbnails and colours are further away\n"
+         "than this (the closest page is always kept). 0 turns this off. Default = 0")
 
-for video_name in video_names:
-    # This is our "play head". We haven't seen any frames of the video, 
-    # so it's at 0.
-    duration = 0
-    # This will store which of the pages was seen, and when.
-    timeline = []
-    
-    # if there's filepath information in the video_name,
-    if len(video_name.split("/")[-1].split("\\")) > 1:
-        # just extract the file component, for prettiness later on.
-        video_title = video_name.split("/")[-1]
-    else:
-        video_title = video_name
-        
-    video = cv2.VideoCapture(video_name) # loading the video up.
-    if args.verbose:
-        print("Analysing " + video_title + "...")
-        
-    # used to make a pretty loading bar.
-    total_frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) 
+parser.add_argument(
+    "--cascade_validate",
+    action="store_true",
+    help="With --cascade_top_k, also run the full search on every frame, and report\n"
+         "how often they agree and how much faster the cascade was.")
 
-    current_time = 0
-    current_frame = 0
-    
-    loading_bar = tqdm(total=total_frame_count, leave=True, unit="frames", 
-                       bar_format="{l_bar}{bar}| {remaining} {rate_fmt} ")
+parser.add_argument(
+    "--decode_mode",
+    type=str,
+    choices=utt.decode_modes,
+    default=DEFAULT_OPTIONS["decode_mode"],
+    help='"sequential" reads through the video once, only fully decoding the frames we analyse.\n'
+         '"seek" jumps to every analysed frame (faster for very low sample rates).\n'
+         '"ffmpeg" lets ffmpeg pick out and shrink the frames we analyse, so full size frames\n'
+         'are never copied out of the decoder (needs ffmpeg).\n'
+         '"packets" looks at the size of every (still encoded) frame first, and only decodes\n'
+         'around the likely page changes (and every --heartbeat_interval seconds). Default = "sequential"')
+
+parser.add_argument(
+    "--gray_frames",
+    action="store_true",
+    help="With decode_mode ffmpeg, have ffmpeg send greyscale frames.")
+
+parser.add_argument(
+    "--burst_factor",
+    type=float,
+    default=DEFAULT_OPTIONS["burst_factor"],
+    help="With decode_mode packets, how many times bigger than usual a frame must be to count as a\n"
+         "likely page change. Default = 4")
+
+parser.add_argument(
+    "--burst_padding",
+    type=float,
+    default=DEFAULT_OPTIONS["burst_padding"],
+    help="With decode_mode packets, how many seconds either side of a likely page change we decode. Default = 1")
+
+parser.add_argument(
+    "--heartbeat_interval",
+    type=float,
+    default=DEFAULT_OPTIONS["heartbeat_interval"],
+    help="With decode_mode packets, how often (in seconds) we check the page anyway. Default = 10")
+
+parser.add_argument(
+    "--keyframe_change",
+    type=float,
+    default=DEFAULT_OPTIONS["keyframe_change"],
+    help="With decode_mode packets, how much bigger or smaller (as a fraction) a keyframe must be\n"
+         "than the one before to count as a likely page change. Default = 0.05")
+
+parser.add_argument(
+    "--frame_cache",
+    type=str,
+    default=DEFAULT_OPTIONS["frame_cache"],
+    help="A database file where the page on each (shrunk) frame is remembered, so screens that have been\n"
+         'seen before, in any video, aren\'t detected again. With --cascade_top_k (or --transition_graph),\n'
+         'new frames are only added with --cascade_validate (or --prior_validate). Default = "" (no frame cache)')
+
+parser.add_argument(
+    "--frame_cache_size",
+    type=int,
+    default=DEFAULT_OPTIONS["frame_cache_size"],
+    help="How many frames the frame cache remembers (the least recently seen are forgotten first). Default = 100000")
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=DEFAULT_OPTIONS["workers"],
+    help="How many videos to analyse at the same time (one per CPU core). Default = 1")
+
+parser.add_argument(
+    "--segments",
+    type=int,
+    default=DEFAULT_OPTIONS["segments"],
+    help="Split each video into this many time ranges, which are analysed at the same time\n"
+         "(by --workers processes, or one per segment). Always decodes sequentially. Default = 1")
+
+parser.add_argument(
+    "--checkpoint_interval",
+    type=float,
+    default=DEFAULT_OPTIONS["checkpoint_interval"],
+    help="How often (in seconds of video) we save our progress to timings-<video>.checkpoint.json,\n"
+         "while the csv file is written. Default = 30")
+
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Carry on from the checkpoint of any unfinished videos (with the same settings),\n"
+         "instead of starting them over (only with --decode_mode sequential).")
+
+parser.add_argument(
+    "--metrics",
+    action="store_true",
+    help="Count and time every step (video read/grab/retrieve/set/get, resize,\n"
+         "detectAndCompute and each page's match), and save the counters and latency\n"
+         "histograms next to each csv file, as timings-<video>.metrics.json and a\n"
+         "Prometheus textfile, timings-<video>.prom.")
+
+parser.add_argument(
+    "--cprofile",
+    action="store_true",
+    help="Profile the analysis of each video with cProfile, print the slowest functions,\n"
+         "and save the profile as timings-<video>.prof (for pstats or snakeviz). With --segments,\n"
+         "the segments' profiles are added together.")
+
+parser.add_argument(
+    "--live",
+    action="store_true",
+    help="Classify a session while it's recorded. video_recording is then \"-\" for raw bgr24 frames\n"
+         "piped into stdin (e.g. from ffmpeg ... -f rawvideo -pix_fmt bgr24 -), or a recording that's\n"
+         "still being written (e.g. .ts or .mkv), which ffmpeg follows (and ffprobe measures, unless\n"
+         "there's a --live_size). Page changes are printed as they happen, and each frame's latency\n"
+         "is saved to latency-live.csv.")
+
+parser.add_argument(
+    "--live_size",
+    type=str,
+    default=DEFAULT_OPTIONS["live_size"],
+    help="With --live, the width and height of the frames, e.g. 1280x720. Needed for stdin.\n"
+         'For a growing recording, the frames are scaled to this size. Default = "" (the recording\'s size)')
+
+parser.add_argument(
+    "--live_fps",
+    type=float,
+    default=DEFAULT_OPTIONS["live_fps"],
+    help="With --live, how many frames arrive per second. Default = 30")
+
+parser.add_argument(
+    "--live_queue",
+    type=int,
+    default=DEFAULT_OPTIONS["live_queue"],
+    help="With --live, how many sampled frames can wait to be classified. When it's full,\n"
+         "the oldest frame is dropped, so we never fall further behind. Default = 4")
+
+parser.add_argument(
+    "--live_timeout",
+    type=float,
+    default=DEFAULT_OPTIONS["live_timeout"],
+    help="With --live, how long (in seconds) a growing recording can stop growing before\n"
+         "we decide that it's finished. Default = 10")
+
+parser.add_argument(
+    "--header",
+    type=bool,
+    default=DEFAULT_OPTIONS["header"],
+    help="Specifies whether to write an initial row of header data to the output file(s). Default = True")
     
-    frame = 'the first frame'
-    while current_frame < total_frame_count and frame is not None:
-        ret, frame = video.read()
-        
-        # most videos don't have EXACT integer frame rates, so this finds the
-        # closest next frame to analyse.
-        current_time = video.get(cv2.CAP_PROP_POS_MSEC) 
-            
-        if frame is not None:
-            tiny_frame = cv2.resize(frame, (0,0), fx=args.resize_factor,
-                                                  fy=args.resize_factor)
-            page_and_confidence = detect_page(tiny_frame, full_descriptors)
-            
-            # move our "play head", onto the next frame for analysis
-            duration += sampling_interval
-            
-            video.set(cv2.CAP_PROP_POS_MSEC, duration)
-            new_time = video.get(cv2.CAP_PROP_POS_MSEC)
-            new_frame = video.get(cv2.CAP_PROP_POS_FRAMES)
-            
-            # clamp the loading bar between 0 and 1
-            bar_chunk = max(new_frame-current_frame,0)
-            loading_bar.update(bar_chunk)
-            timeline.append([page_and_confidence, (current_time)/1000])
-            current_frame = new_frame
-
-    loading_bar.close()
-
-    ### CLEANING UP THE TIMELINE ###
-    # if there's any pages with fewer than (default=10) keypoints,
-    # give their labels a "low confident detection"
-    timeline = [page if page[0][1] > args.feature_cutoff else [["low confidence detection    ", 0],0] for page in timeline]
+parser.add_argument(
+    '-v', '--verbose', 
+    #action='store_true',
+    default=True,
+    help='Enable verbose output.')
     
-    # the first page that we detect in the video.
-    timeline_cleaned = [[timeline[0][0][0], 0, 0]]
-    cumulative = 0
-    for i in range(len(timeline)):
-        # if we have a low confidence detection, ignore it.
-        if timeline[i][0][0] == "low confidence detection    ": 
-            # apologies for the 'pass'. I know it's not the *best* to have them!
-            pass
-        
-        # if the current page is different from the most recent one seen,
-        elif timeline[i][0][0] != timeline_cleaned[-1][0]:
-            timeline_cleaned[-1][2] = timeline[i][1] # cumulative 
-            timeline_cleaned[-1][1] = timeline[i][1] - timeline_cleaned[-1][1] 
-            
-            # add that page to the cleaned timeline
-            timeline_cleaned.append([timeline[i][0][0], timeline[i][1],
-                                     'temp_time'])
-            
-    timeline_cleaned[-1][1] = timeline[i][1] - timeline_cleaned[-1][1] 
-    timeline_cleaned[-1][2] = timeline[i][1]
-
-    for i in range(len(timeline_cleaned)):
-            timeline_cleaned[i][0] = timeline_cleaned[i][0][:-4]
+def save_timeline(timeline, output_folder_path, args):
+    filepath = timeline.save(output_folder_path, args)
+    if args.verbose:
+        print(os.path.basename(filepath) + " written.")
+    return filepath
+
+def main():
+    args = parser.parse_args()
+    if args.adaptive and args.segments > 1:
+        parser.error("--adaptive can't be used with --segments.")
+    if args.resume and args.segments > 1:
+        parser.error("--resume can't be used with --segments.")
+    if args.resume and args.decode_mode != "sequential":
+        # a resumed video is read sequentially from its checkpoint.
+        parser.error("--resume can only be used with --decode_mode sequential.")
+    if args.live and (args.adaptive or args.segments > 1 or args.workers > 1):
+        parser.error("--live can't be used with --adaptive, --segments or --workers.")
+    if args.decode_mode == "ffmpeg" and shutil.which("ffmpeg") is None:
+        parser.error("--decode_mode ffmpeg needs ffmpeg to be installed.")
+    if args.gray_frames and args.decode_mode != "ffmpeg":
+        parser.error("--gray_frames can only be used with --decode_mode ffmpeg.")
+    if args.cascade_top_k > 0 and args.matcher == "flann":
+        # one flann query already covers every page, so there's nothing to skip.
+        parser.error("--cascade_top_k can only be used with --matcher brute.")
+    #input(args.app_screens_directory)
+    gc.collect() # If you close the code early, 
+                 # this makes sure that we've got enough memory to work with.
+
+    ### ADDITIONAL FILETYPES ###
+    image_extensions = utt.add_file_types(utt.image_extensions,
+                                          args.additional_image_types)
+    video_extensions = utt.add_file_types(utt.video_extensions,
+                                          args.additional_video_types)
+    ############################
+
+
+    ### IF THE USER SPECIFIES ONE OR MORE VIDEOS ####
+
+    if args.live:
+        video_names = []
+    elif type(args.video_recording) == list:
+        video_names = args.video_recording
+    elif type(args.video_recording) == str:
+        if args.video_recording[-4:].lower() in video_extensions:
+            video_names = [args.video_recording]
+        else:
+            video_names = getFileNames(args.video_recording, video_extensions)
+    #################################################
+
+    image_names = getFileNames(args.app_screens_directory, image_extensions)
+
+    if args.no_cache:
+        cache_path = None
+    elif args.descriptor_cache:
+        cache_path = args.descriptor_cache
+    else:
+        cache_path = os.path.join(args.app_screens_directory,
+                                  ".screen_features_cache.npz")
 
-    
-    ### WRITING TO A FILE ###
-    csv_title = "timings-" + video_title[:-4] + ".csv"
-    filepath = os.path.join(output_folder_path, csv_title)
-    with open(filepath, "w", newline="") as csv_file:
-        writer = csv.writer(csv_file)
-        if args.header == True:
-            # write a header.
-            writer.writerow(['Screen_Title','Time_Taken_(Seconds)', 
-                             'Cumulative_Time_(Seconds)'])
-        for row in timeline_cleaned:
-            writer.writerow(row)
     if args.verbose:
-        print(csv_title + " written.")
-        csv_file.close()
+        print("Loading in images and calculating features (Please Wait)")
+
+    try:
+        index = utt.ScreenIndex.from_screenshots(
+            image_names, args.resize_factor, args.features, args.matcher,
+            args.flann_ratio, cache_path, args.rebuild_cache, args.verbose,
+            utt.parse_regions(args.mask_regions))
+    except ValueError as error: # e.g. no AKAZE in this version of OpenCV.
+        parser.error(str(error))
 
-    #########################
-gc.collect()
+    if args.cascade_top_k > 0:
+        index.load_signatures()
 
+    if args.auto_viewport and not args.roi:
+        index.load_aspect()
+
+    if args.transition_graph:
+        # learnt before we write any new csv files into the same folder.
+        index.load_transition_graph(args.transition_graph)
+
+    if args.verbose:
+        print("Loaded images.")
+
+    folder_name = args.output_data_directory.split("/")[-1].split("\\")[-1]
+    output_folder_path = os.path.join(os.getcwd(), folder_name)
+
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    if args.live:
+        try:
+            utt.analyse_live(args.video_recording, index, args,
+                             output_folder_path)
+        except ValueError as error: # e.g. no --live_size for stdin.
+            parser.error(str(error))
+    elif args.segments > 1:
+        workers = args.workers if args.workers > 1 else args.segments
+        pool, shared_folder = utt.start_worker_pool(index, args, workers)
+        try:
+            with pool:
+                for video_name in video_names:
+                    timeline = utt.analyse_video_in_segments(video_name, index,
+                                                             args, pool)
+                    save_timeline(timeline, output_folder_path, args)
+        finally:
+            shutil.rmtree(shared_folder, ignore_errors=True)
+    elif args.workers > 1 and len(video_names) > 1:
+        # a report of every video that went wrong, and why.
+        report_path = os.path.join(output_folder_path, "batch_errors.txt")
+        if os.path.exists(report_path): # from an older batch.
+            os.remove(report_path)
+        errors = utt.analyse_videos_in_parallel(video_names, index, args,
+                                                output_folder_path)
+        if errors:
+            with open(report_path, "w") as report:
+                for video_name, error in errors:
+                    report.write(video_name + "\n" + error + "\n")
+            print("{} of {} videos failed:".format(len(errors),
+                                                   len(video_names)))
+            for video_name, error in errors:
+                print("    " + video_name + ": " +
+                      error.strip().split("\n")[-1])
+            print("Full details are in " + report_path)
+    else:
+        for video_name in video_names:
+            if args.verbose:
+                print("Analysing " + utt.file_title(video_name) + "...")
+            filepath = utt.stream_video(video_name, index, args,
+                                        output_folder_path)
+            if args.verbose:
+                print(os.path.basename(filepath) + " written.")
+    gc.collect()
+
+if __name__ == "__main__":
+    main()
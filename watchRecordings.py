@@ -0,0 +1,282 @@
+import argparse # This takes in any command-line arguments that the users enters.
+import hashlib # to recognise recordings that have been copied, but not changed.
+import json # to remember which recordings we've already analysed.
+import os # This allows us to check other directories, if we need to.
+import shutil # to tidy up the folder of shared screenshot features afterwards
+import time # to wait between looks at the folder.
+import traceback # so one bad plot doesn't stop the watcher
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import userTestingTool as utt
+
+"""
+Watch Recordings
+Keep an eye on a folder of screen recordings, and analyse (and plot) each new or changed
+recording as soon as it's finished being written.
+
+The screenshot features are only calculated once, when we start, and a manifest remembers
+which recordings have already been analysed, so nothing is analysed twice (even if you
+stop and start the watcher).
+
+Usage: python3 watchRecordings.py <path/to/app_screenshots> <path/to/screen_recordings>
+
+Args:
+    app_screens_directory (str): Path to the App Screens Directory.
+    recordings_directory (str): The folder that the recordings are saved into.
+    output_data_directory (str): The name of the folder where we'll save our generated metrics. Default = 'generated_metrics'
+    output_plot_directory (str): The name of the folder where we'll save our generated plots. Default = 'generated_plots'
+    plot_type (str): The filetype which we save the plots in. Default = ".svg".
+    poll_interval (float): How often (in seconds) we look for new recordings. Default = 5.
+    settle_time (float): How long (in seconds) a recording's size must stay the same before we
+                         decide it's finished being written. Default = 10.
+    hash (bool): Also compare the contents of changed recordings, so recordings that were just
+                 copied (or touched) aren't analysed again. Default = False.
+    workers (int): How many recordings to analyse at the same time. Default = 1.
+    once (bool): Analyse whatever is waiting, then stop (instead of watching forever). Default = False.
+    sample_rate (int): As in videoToMetricsConverter.py. Default = 2.
+    resize_factor (float): As in videoToMetricsConverter.py. Default = 0.25.
+    features (str): As in videoToMetricsConverter.py. Default = "sift".
+    matcher (str): As in videoToMetricsConverter.py. Default = "brute".
+
+Returns:
+    None
+"""
+
+def file_hash(path):
+    hasher = hashlib.sha1()
+    with open(path, "rb") as video_file:
+        for chunk in iter(lambda: video_file.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class RecordingWatcher:
+    """Works out which recordings need analysing, and remembers which have
+    been analysed (in a manifest of their size, modification time and,
+    optionally, contents)."""
+    def __init__(self, recordings_directory, output_folder_path,
+                 settle_time=10, use_hash=False):
+        self.recordings_directory = recordings_directory
+        self.output_folder_path = output_folder_path
+        self.settle_time = settle_time
+        self.use_hash = use_hash
+        self.manifest_path = os.path.join(output_folder_path,
+                                          ".watch_manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as manifest_file:
+                self.manifest = json.load(manifest_file)
+        # path -> ((size, mtime), when we first saw it like that)
+        self.seen = {}
+        self.queued = set()
+
+    def save_manifest(self):
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    def csv_path(self, video_name):
+        return os.path.join(self.output_folder_path,
+                            "timings-" + utt.file_title(video_name)[:-4] + ".csv")
+
+    def needs_analysing(self, path, status):
+        record = self.manifest.get(path)
+        if record is None:
+            # analysed before the watcher was started?
+            csv_path = self.csv_path(path)
+            if (os.path.exists(csv_path) and
+                    os.path.getmtime(csv_path) >= status.st_mtime):
+                self.remember(path, status, csv_path, None)
+                return False
+            return True
+        if record["size"] == status.st_size and record["mtime"] == status.st_mtime:
+            return False
+        if self.use_hash and record.get("hash") == file_hash(path):
+            # the same recording, just copied or touched.
+            record["mtime"] = status.st_mtime
+            self.save_manifest()
+            return False
+        return True
+
+    def ready_recordings(self, video_extensions):
+        """Recordings that are new (or changed), and haven't changed size for
+        settle_time seconds (so they've probably finished being written)."""
+        now = time.time()
+        ready = []
+        for path in sorted(utt.getFileNames(self.recordings_directory,
+                                            video_extensions)):
+            path = os.path.abspath(path)
+            if path in self.queued:
+                continue
+            try:
+                status = os.stat(path)
+            except OSError: # deleted while we were looking.
+                continue
+            signature = (status.st_size, status.st_mtime)
+            if path not in self.seen or self.seen[path][0] != signature:
+                self.seen[path] = (signature, now)
+            if now - self.seen[path][1] < self.settle_time:
+                continue
+            if self.needs_analysing(path, status):
+                ready.append(path)
+        return ready
+
+    def remember(self, path, status, csv_path, error, plot_error=None):
+        self.manifest[path] = {"size": status.st_size, "mtime": status.st_mtime,
+                               "csv": csv_path, "error": error,
+                               "plot_error": plot_error}
+        if self.use_hash:
+            self.manifest[path]["hash"] = file_hash(path)
+        self.save_manifest()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch Recordings\n"
+                    "Analyse (and plot) each new or changed recording in a folder, as soon as it's finished.",
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        "app_screens_directory",
+        type=str,
+        help="Path to the App Screens Directory.")
+    parser.add_argument(
+        "recordings_directory",
+        type=str,
+        help="The folder that the recordings are saved into.")
+    parser.add_argument(
+        "--output_data_directory",
+        type=str,
+        default="generated_metrics",
+        help="The name of the folder where we'll save our generated metrics. Default = 'generated_metrics'")
+    parser.add_argument(
+        "--output_plot_directory",
+        type=str,
+        default="generated_plots",
+        help="The name of the folder where we'll save our generated plots. Default = 'generated_plots'")
+    parser.add_argument(
+        "--plot_type",
+        type=str,
+        default=".svg",
+        help='Specify the output image filetype. Default=".svg"')
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=5,
+        help="How often (in seconds) we look for new recordings. Default = 5")
+    parser.add_argument(
+        "--settle_time",
+        type=float,
+        default=10,
+        help="How long (in seconds) a recording's size must stay the same before we decide\n"
+             "it's finished being written. Default = 10")
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Also compare the contents of changed recordings, so recordings that were just\n"
+             "copied (or touched) aren't analysed again.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="How many recordings to analyse at the same time. Default = 1")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Analyse whatever is waiting, then stop (instead of watching forever).")
+    parser.add_argument(
+        "--sample_rate",
+        type=int,
+        default=utt.DEFAULT_OPTIONS["sample_rate"],
+        help="As in videoToMetricsConverter.py. Default = 2")
+    parser.add_argument(
+        "--resize_factor",
+        type=float,
+        default=utt.DEFAULT_OPTIONS["resize_factor"],
+        help="As in videoToMetricsConverter.py. Default = 0.25")
+    parser.add_argument(
+        "--features",
+        type=str,
+        choices=list(utt.feature_backends.keys()),
+        default=utt.DEFAULT_OPTIONS["features"],
+        help='As in videoToMetricsConverter.py. Default = "sift"')
+    parser.add_argument(
+        "--matcher",
+        type=str,
+        choices=["brute", "flann"],
+        default=utt.DEFAULT_OPTIONS["matcher"],
+        help='As in videoToMetricsConverter.py. Default = "brute"')
+    args = parser.parse_args()
+
+    options = utt.default_options(sample_rate=args.sample_rate,
+                                  resize_factor=args.resize_factor,
+                                  features=args.features, matcher=args.matcher)
+    output_folder_path = os.path.join(os.getcwd(), args.output_data_directory)
+    plot_folder_path = os.path.join(os.getcwd(), args.output_plot_directory)
+    os.makedirs(output_folder_path, exist_ok=True)
+    os.makedirs(plot_folder_path, exist_ok=True)
+
+    print("Loading in images and calculating features (Please Wait)")
+    try:
+        index = utt.ScreenIndex.from_screenshots(
+            args.app_screens_directory, options.resize_factor, options.features,
+            options.matcher, options.flann_ratio,
+            os.path.join(args.app_screens_directory, ".screen_features_cache.npz"))
+    except ValueError as error: # e.g. no AKAZE in this version of OpenCV.
+        parser.error(str(error))
+    page_names = index.page_names
+
+    watcher = RecordingWatcher(args.recordings_directory, output_folder_path,
+                               0 if args.once else args.settle_time, args.hash)
+    pool, shared_folder = utt.start_worker_pool(index, options, args.workers,
+                                                output_folder_path)
+    waiting = [] # ready recordings, waiting for a worker
+    running = {} # future -> (recording, its size and modification time)
+    print("Watching " + args.recordings_directory + " (Ctrl+C to stop)")
+    try:
+        with pool:
+            while True:
+                waiting += watcher.ready_recordings(utt.video_extensions)
+                watcher.queued.update(waiting)
+                # only give the workers a few recordings at a time, so new
+                # recordings don't wait behind a huge queue.
+                while waiting and len(running) < 2*args.workers:
+                    video_name = waiting.pop(0)
+                    running[pool.submit(utt.batch_worker, video_name)] = (
+                        video_name, os.stat(video_name))
+                if not running:
+                    if args.once:
+                        break
+                    time.sleep(args.poll_interval)
+                    continue
+                done, _ = wait(running, timeout=args.poll_interval,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    recording, status = running.pop(future)
+                    video_name, filepath, error = future.result()
+                    watcher.queued.discard(recording)
+                    if error is not None:
+                        error = error.strip().split("\n")[-1]
+                        watcher.remember(recording, status, filepath, error)
+                        print("Failed: " + video_name + ": " + error)
+                        continue
+                    print(os.path.basename(filepath) + " written.")
+                    # plot it straight away.
+                    plot_error = None
+                    try:
+                        plot_path = utt.render_plot(filepath, page_names,
+                                                    plot_folder_path,
+                                                    args.plot_type,
+                                                    options.header)
+                        print(os.path.basename(plot_path) + " plotted.")
+                    except Exception:
+                        plot_error = traceback.format_exc().strip().split("\n")[-1]
+                        print("Couldn't plot " + os.path.basename(filepath) +
+                              ": " + plot_error)
+                    watcher.remember(recording, status, filepath, None,
+                                     plot_error)
+    except KeyboardInterrupt:
+        print("Stopping.")
+    finally:
+        shutil.rmtree(shared_folder, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()